@@ -0,0 +1,92 @@
+"""
+Бенчмарк хранилища черновиков: соединение на каждый вызов (как было до
+общего WAL-соединения) против database.py.
+
+16 потоков × 300 итераций: сохранить черновик, прочитать его, каждый
+десятый — удалить. Базы создаются во временном каталоге.
+
+    python bench/db_connections.py [потоков] [итераций]
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import database  # noqa: E402
+
+
+# ---------- Было: новое соединение и commit на каждый вызов ----------
+class PerCall:
+    def __init__(self, path: str):
+        self.path = path
+        with closing(sqlite3.connect(path)) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS drafts (user_id INTEGER PRIMARY KEY, data TEXT)")
+            con.commit()
+
+    def save(self, user_id: int, data: str):
+        with closing(sqlite3.connect(self.path)) as con:
+            con.execute("REPLACE INTO drafts (user_id, data) VALUES (?, ?)", (user_id, data))
+            con.commit()
+
+    def load(self, user_id: int):
+        with closing(sqlite3.connect(self.path)) as con:
+            row = con.execute("SELECT data FROM drafts WHERE user_id=?", (user_id,)).fetchone()
+            return row[0] if row else None
+
+    def delete(self, user_id: int):
+        with closing(sqlite3.connect(self.path)) as con:
+            con.execute("DELETE FROM drafts WHERE user_id=?", (user_id,))
+            con.commit()
+
+
+# ---------- Стало: database.py (писатель под блокировкой, читатели по потокам) ----------
+class Shared:
+    def __init__(self, path: str):
+        database.DB_PATH = path
+        database.init_db()
+
+    save = staticmethod(database.save_draft)
+
+    @staticmethod
+    def load(user_id: int):
+        # то же чтение, что собирает черновик из снимка и журнала
+        return database._read_state(database._get_reader(), user_id)[0]
+
+    delete = staticmethod(database.delete_draft)
+
+
+def run(store, threads: int, iterations: int) -> float:
+    def worker(n: int):
+        user_id = 1000 + n
+        for i in range(iterations):
+            store.save(user_id, json.dumps({"location": "ladoga", "step": i}))
+            store.load(user_id)
+            if i % 10 == 9:
+                store.delete(user_id)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return time.perf_counter() - start
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    ops = threads * iterations
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (("before", PerCall), ("after", Shared)):
+            elapsed = run(factory(os.path.join(tmp, f"{name}.db")), threads, iterations)
+            print(f"{name:7} {elapsed:6.2f}s  {ops / elapsed / 1000:6.1f}k ops/s  "
+                  f"{elapsed / ops * 1e6:6.0f} us/op")
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
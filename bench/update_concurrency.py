@@ -0,0 +1,81 @@
+"""
+Бенчмарк обработки апдейтов: последовательная обработка PTB по умолчанию
+против PerUserUpdateProcessor с разным max_concurrent_updates.
+
+200 апдейтов от 20 пользователей идут через Application.update_queue,
+обработчик ждёт 20 мс (имитация запроса к Bot API). В сеть бот не ходит.
+Заодно проверяется, что апдейты каждого пользователя обработаны по порядку.
+
+    python bench/update_concurrency.py
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from telegram import Chat, Message, Update, User  # noqa: E402
+from telegram.ext import ApplicationBuilder, TypeHandler  # noqa: E402
+
+from processing import PerUserUpdateProcessor  # noqa: E402
+
+USERS = 20
+UPDATES = 200
+LATENCY = 0.02
+
+
+def make_updates() -> list[Update]:
+    updates = []
+    for i in range(UPDATES):
+        user = User(id=1 + i % USERS, first_name="u", is_bot=False)
+        chat = Chat(id=user.id, type=Chat.PRIVATE)
+        message = Message(message_id=i, date=datetime.now(), chat=chat, from_user=user, text=str(i))
+        updates.append(Update(update_id=i, message=message))
+    return updates
+
+
+async def run(processor) -> tuple[float, bool]:
+    builder = ApplicationBuilder().token("1:bench").updater(None)
+    if processor is not None:
+        builder = builder.concurrent_updates(processor)
+    app = builder.build()
+    # без getMe: бот считается инициализированным
+    app.bot._bot_user = User(id=1, first_name="bench", is_bot=True, username="bench_bot")
+    app.bot._initialized = True
+
+    seen: dict[int, list[int]] = {}
+    done = asyncio.Event()
+
+    async def handler(update: Update, context):
+        await asyncio.sleep(LATENCY)
+        seen.setdefault(update.effective_user.id, []).append(update.update_id)
+        if sum(map(len, seen.values())) == UPDATES:
+            done.set()
+
+    app.add_handler(TypeHandler(Update, handler))
+    async with app:
+        await app.start()
+        start = time.perf_counter()
+        for update in make_updates():
+            await app.update_queue.put(update)
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        await app.stop()
+    ordered = all(ids == sorted(ids) for ids in seen.values())
+    return elapsed, ordered
+
+
+async def main():
+    cases = [("sequential (default)", None)]
+    cases += [(f"PerUser max={n}", PerUserUpdateProcessor(n)) for n in (4, 16, 64)]
+    for name, processor in cases:
+        elapsed, ordered = await run(processor)
+        print(f"{name:22} {UPDATES / elapsed:6.0f} upd/s   порядок по пользователю: "
+              f"{'да' if ordered else 'НЕТ'}")
+    print(f"(потолок: {USERS} пользователей × {1 / LATENCY:.0f}/с)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
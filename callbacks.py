@@ -0,0 +1,125 @@
+import logging
+from typing import Iterable
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+# ---------- Формат callback_data ----------
+# callback_data = префикс + аргументы: "go_back:COORDS", "mod_ok:17".
+# Старые кнопки мастера используют "_" вместо ":" ("loc_ladoga", "nav_next",
+# "temp_high") — для них префиксом считается всё до первого "_".
+SEP = ":"
+MAX_CALLBACK_DATA = 64    # ограничение Bot API, в байтах
+
+
+def encode(prefix: str, *args: object) -> str:
+    data = SEP.join((prefix, *map(str, args)))
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data!r}")
+    return data
+
+
+def decode(data: str) -> tuple[str, list[str]]:
+    """'go_back:COORDS' -> ('go_back', ['COORDS']); 'loc_r_sura' -> ('loc', ['r_sura'])."""
+    if SEP in data:
+        prefix, *args = data.split(SEP)
+        return prefix, args
+    prefix, _, arg = data.partition("_")
+    return prefix, [arg] if arg else []
+
+
+# ---------- Роутер ----------
+class CallbackRouter(BaseHandler):
+    """
+    Обработчик callback-запросов с диспетчеризацией по словарю.
+
+    routes — пары (ключ, обработчик). Ключ — либо точное значение
+    callback_data ("go_next:COORDS"), либо префикс со звёздочкой
+    ("go_next*", "loc*").
+    Сначала ищется точное совпадение, потом префикс: два обращения к dict
+    вместо перебора регулярных выражений, сколько бы шагов ни было.
+    guard(update, context) вызывается перед обработчиком: если он вернул
+    не None, это и есть результат, а обработчик не вызывается.
+    """
+
+    __slots__ = ("name", "_exact", "_prefix", "_guard")
+
+    def __init__(self, name: str, routes: Iterable[tuple[str, object]], block: bool = True,
+                 guard=None):
+        super().__init__(self._not_routed, block=block)
+        self.name = name
+        self._guard = guard
+        self._exact: dict[str, object] = {}
+        self._prefix: dict[str, object] = {}
+        for key, handler in routes:
+            self.add(key, handler)
+
+    def add(self, key: str, handler):
+        if len(key.encode()) > MAX_CALLBACK_DATA:
+            raise ValueError(f"{self.name}: маршрут {key!r} недостижим — длиннее {MAX_CALLBACK_DATA} байт")
+        table = self._exact
+        if key.endswith("*"):
+            key, table = key[:-1], self._prefix
+        if key in table:
+            raise ValueError(
+                f"{self.name}: маршрут {key!r} уже занят {table[key].__name__}, "
+                f"нельзя назначить {handler.__name__}"
+            )
+        table[key] = handler
+
+    @property
+    def prefix_routes(self) -> dict[str, object]:
+        return dict(self._prefix)
+
+    @property
+    def exact_routes(self) -> dict[str, object]:
+        return dict(self._exact)
+
+    def resolve(self, data: str):
+        handler = self._exact.get(data)
+        if handler is None:
+            handler = self._prefix.get(decode(data)[0])
+        return handler
+
+    def check_update(self, update: object):
+        if isinstance(update, Update) and update.callback_query:
+            data = update.callback_query.data
+            if isinstance(data, str):
+                return self.resolve(data)
+        return None
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        if self._guard is not None:
+            result = await self._guard(update, context)
+            if result is not None:
+                return result
+        return await check_result(update, context)
+
+    async def _not_routed(self, update, context):
+        return None
+
+
+def check_routes(routers: Iterable[CallbackRouter], emitted: Iterable[str]):
+    """
+    Проверка при старте: каждая кнопка из реестра клавиатур должна куда-то
+    вести, а каждый маршрут — соответствовать хотя бы одной кнопке.
+    Коллизии ключей внутри роутера ловит CallbackRouter.add().
+    """
+    routers = list(routers)
+    emitted = set(emitted)
+    emitted_prefixes = {decode(data)[0] for data in emitted}
+
+    for data in sorted(emitted):
+        if not any(router.resolve(data) for router in routers):
+            logger.warning("Кнопка %r не обрабатывается ни одним роутером", data)
+
+    for router in routers:
+        for key in router.exact_routes:
+            if key not in emitted:
+                logger.warning("%s: маршрут %r недостижим — такой кнопки нет", router.name, key)
+        for key in router.prefix_routes:
+            if key not in emitted_prefixes:
+                logger.warning("%s: маршрут %r* недостижим — такой кнопки нет", router.name, key)
@@ -1,35 +1,765 @@
+import asyncio
+import json
+import logging
 import sqlite3
-from contextlib import closing
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 DB_PATH = "drafts.db"
 
+logger = logging.getLogger(__name__)
+
+# Одно долгоживущее соединение на запись: его открывает init_db(),
+# а все записи идут только через него под блокировкой.
+# sqlite3 сам кэширует подготовленные выражения (cached_statements),
+# поэтому тексты SQL держим в константах и не собираем заново.
+_con: sqlite3.Connection | None = None
+_lock = threading.Lock()
+
+# Читатели: у каждого потока своё соединение (в WAL они не мешают писателю)
+_local = threading.local()
+_readers: list[sqlite3.Connection] = []
+_readers_lock = threading.Lock()
+
+# Async API: один поток-писатель (SQLite всё равно пишет по одному)
+# и небольшой пул читателей, чтобы диск не блокировал event loop бота.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_reader_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-reader")
+
+# Write-behind: последние данные черновика по user_id, ещё не записанные в БД.
+# Повторные сохранения одного пользователя в пределах окна схлопываются,
+# а flush_drafts() пишет всё накопленное одной транзакцией.
+FLUSH_DELAY = 2.0
+_pending: dict[int, str] = {}
+_writing: dict[int, str] = {}      # отданы писателю: при ошибке записи вернутся в _pending
+_flush_handle: asyncio.TimerHandle | None = None
+_flush_tasks: set[asyncio.Task] = set()
+
+# Журнал черновиков: вместо перезаписи всего JSON на каждом шаге пишем
+# только изменившиеся поля (value = JSON значения, NULL — поле удалено).
+# drafts хранит снимок и seq последней свёрнутой в него записи журнала;
+# Состояние черновика = снимок + хвост журнала с seq больше этого значения.
+# Сворачивание идёт в фоне на потоке-писателе, когда хвост становится длинным.
+# Живой черновик читается из user_data (persistence.py); отсюда читаются
+# только история правок поста (load_post_history) и возраст для TTL.
+# При отправке поста его записи журнала не удаляются, а получают post_id.
+COMPACT_THRESHOLD = 20
+_known: dict[int, dict] = {}       # последнее записанное состояние (только поток-писатель)
+_tail: dict[int, int] = {}         # длина несвёрнутого хвоста журнала по user_id
+_to_compact: set[int] = set()
+
+_SQL_SNAPSHOT = "UPDATE drafts SET data=?, seq=? WHERE user_id=?"
+_SQL_TOUCH = (
+    "INSERT INTO drafts (user_id, data, seq, updated_at) VALUES (?, NULL, 0, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET updated_at=excluded.updated_at"
+)
+_SQL_LOAD = "SELECT data, seq FROM drafts WHERE user_id=?"
+_SQL_JOURNAL_ADD = "INSERT INTO draft_journal (user_id, key, value, created_at) VALUES (?, ?, ?, ?)"
+_SQL_JOURNAL_TAIL = (
+    "SELECT seq, key, value FROM draft_journal "
+    "WHERE user_id=? AND post_id IS NULL AND seq>? ORDER BY seq"
+)
+_SQL_DELETE = "DELETE FROM drafts WHERE user_id=?"
+_SQL_JOURNAL_DELETE = "DELETE FROM draft_journal WHERE user_id=? AND post_id IS NULL"
+
+
+def _connect() -> sqlite3.Connection:
+    con = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        isolation_level=None,     # autocommit: один REPLACE = одна транзакция
+        cached_statements=64,
+    )
+    # WAL: читатели не блокируют писателя, а commit — это дозапись в журнал
+    con.execute("PRAGMA journal_mode=WAL")
+    # В WAL режиме NORMAL не делает fsync на каждый commit, только на checkpoint
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA busy_timeout=5000")
+    return con
+
+
+def _get_con() -> sqlite3.Connection:
+    global _con
+    if _con is None:
+        _con = _connect()
+    return _con
+
+
+def _get_reader() -> sqlite3.Connection:
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = _connect()
+        _local.con = con
+        with _readers_lock:
+            _readers.append(con)
+    return con
+
+
 def init_db():
-    with closing(sqlite3.connect(DB_PATH)) as con:
+    with _lock:
+        con = _get_con()
         con.execute("""
         CREATE TABLE IF NOT EXISTS drafts (
             user_id INTEGER PRIMARY KEY,
             data TEXT
         )
         """)
-        con.commit()
+        columns = {row[1] for row in con.execute("PRAGMA table_info(drafts)")}
+        if "seq" not in columns:
+            con.execute("ALTER TABLE drafts ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        if "updated_at" not in columns:
+            # старым черновикам отсчёт TTL начинается с момента миграции
+            con.execute("ALTER TABLE drafts ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+            con.execute("UPDATE drafts SET updated_at=?", (time.time(),))
+        con.execute("CREATE INDEX IF NOT EXISTS idx_drafts_updated ON drafts (updated_at)")
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS draft_journal (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            created_at REAL NOT NULL
+        )
+        """)
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_draft_journal_user ON draft_journal (user_id, seq)"
+        )
+        # записи отправленного черновика остаются историей правок поста
+        columns = {row[1] for row in con.execute("PRAGMA table_info(draft_journal)")}
+        if "post_id" not in columns:
+            con.execute("ALTER TABLE draft_journal ADD COLUMN post_id INTEGER")
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_draft_journal_post ON draft_journal (post_id, seq)"
+        )
+        # Состояние Application (см. persistence.py)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS ptb_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        )
+        """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS ptb_chat_data (
+            chat_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        )
+        """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS ptb_bot_data (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            data TEXT NOT NULL
+        )
+        """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS ptb_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (name, key)
+        )
+        """)
+        # Служебные значения бота (high-water mark update_id и т.п.)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """)
+        # Очередь модерации: пост попадает сюда из черновика при отправке
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS moderation_queue (
+            post_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            data TEXT NOT NULL,
+            mod_chat_id INTEGER,
+            mod_message_id INTEGER,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """)
+        # id сообщений с самим постом в модераторской (альбом/фото/текст):
+        # при публикации они копируются в канал, а не отправляются заново
+        columns = {row[1] for row in con.execute("PRAGMA table_info(moderation_queue)")}
+        if "mod_post_ids" not in columns:
+            con.execute("ALTER TABLE moderation_queue ADD COLUMN mod_post_ids TEXT")
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_moderation_queue_status "
+            "ON moderation_queue (status, created_at)"
+        )
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_moderation_queue_user "
+            "ON moderation_queue (user_id, status)"
+        )
+        # Архив опубликованных постов: нормализованные поля вместо JSON
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS archive (
+            post_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            author TEXT,
+            location TEXT,
+            point_types TEXT,
+            fish_type TEXT,
+            fishing_type TEXT,
+            fishing_extra TEXT,
+            coords TEXT,
+            temp TEXT,
+            comment TEXT,
+            photo_unique_ids TEXT,
+            channel_id INTEGER,
+            channel_message_ids TEXT,
+            submitted_at REAL NOT NULL,
+            published_at REAL NOT NULL
+        )
+        """)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_archive_location ON archive (location)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_archive_author ON archive (author)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_archive_published ON archive (published_at)")
+        # Очередь публикации (outbox): одобренный пост ждёт здесь отправки в канал.
+        # post_id — ключ идемпотентности: на пост не больше одной задачи.
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS publish_outbox (
+            post_id INTEGER PRIMARY KEY,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+        """)
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_publish_outbox_due ON publish_outbox (next_attempt_at)"
+        )
+        # куда пост уже ушёл: отметка ставится сразу после отправки в канал,
+        # повтор задачи после неё только дописывает архив, а не публикует снова
+        columns = {row[1] for row in con.execute("PRAGMA table_info(publish_outbox)")}
+        if "channel_id" not in columns:
+            con.execute("ALTER TABLE publish_outbox ADD COLUMN channel_id INTEGER")
+        if "channel_message_ids" not in columns:
+            con.execute("ALTER TABLE publish_outbox ADD COLUMN channel_message_ids TEXT")
+
+
+@contextmanager
+def _transaction():
+    """Соединение писателя внутри BEGIN … COMMIT (ROLLBACK при ошибке)."""
+    with _lock:
+        con = _get_con()
+        con.execute("BEGIN")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+
+def close_db():
+    global _con
+    with _lock:
+        if _con is not None:
+            _con.close()
+            _con = None
+    with _readers_lock:
+        for con in _readers:
+            con.close()
+        _readers.clear()
+    _local.__dict__.clear()
+
+
+def _read_state(con: sqlite3.Connection, user_id: int) -> tuple[dict | None, int, int]:
+    """Собирает черновик из снимка и хвоста журнала: (данные, max seq, длина хвоста)."""
+    row = con.execute(_SQL_LOAD, (user_id,)).fetchone()
+    tail = con.execute(_SQL_JOURNAL_TAIL, (user_id, row[1] if row else 0)).fetchall()
+    if not row and not tail:
+        return None, 0, 0
+    state = json.loads(row[0]) if row and row[0] else {}
+    seq = row[1] if row else 0
+    for seq, key, value in tail:
+        if value is None:
+            state.pop(key, None)
+        else:
+            state[key] = json.loads(value)
+    return state, seq, len(tail)
+
+
+def _write_changes(con: sqlite3.Connection, user_id: int, data: str, now: float):
+    prev = _known.get(user_id)
+    if prev is None:
+        prev, _, tail = _read_state(con, user_id)
+        prev = prev or {}
+        _tail[user_id] = tail
+    new = json.loads(data)
+
+    rows = [
+        (user_id, key, json.dumps(value, ensure_ascii=False), now)
+        for key, value in new.items()
+        if key not in prev or prev[key] != value
+    ]
+    rows += [(user_id, key, None, now) for key in prev.keys() - new.keys()]
+    con.execute(_SQL_TOUCH, (user_id, now))
+    if rows:
+        con.executemany(_SQL_JOURNAL_ADD, rows)
+        _tail[user_id] = _tail.get(user_id, 0) + len(rows)
+        if _tail[user_id] >= COMPACT_THRESHOLD:
+            _to_compact.add(user_id)
+    _known[user_id] = new
+
 
 def save_draft(user_id: int, data: str):
-    with closing(sqlite3.connect(DB_PATH)) as con:
-        con.execute(
-            "REPLACE INTO drafts (user_id, data) VALUES (?, ?)",
-            (user_id, data),
+    save_drafts([(user_id, data)])
+
+
+def save_drafts(items: list[tuple[int, str]]):
+    """Записывает в журнал изменившиеся поля нескольких черновиков одной транзакцией."""
+    now = time.time()
+    try:
+        with _transaction() as con:
+            for user_id, data in items:
+                _write_changes(con, user_id, data, now)
+    except Exception:
+        # транзакция откатилась — кэш состояний перечитаем из БД при следующей записи
+        for user_id, _ in items:
+            _known.pop(user_id, None)
+            _tail.pop(user_id, None)
+        raise
+
+
+def compact_drafts():
+    """Сворачивает длинные хвосты журнала в снимки. Журнал при этом не удаляется."""
+    with _transaction() as con:
+        while _to_compact:
+            user_id = _to_compact.pop()
+            state, seq, _ = _read_state(con, user_id)
+            if state is not None:
+                con.execute(_SQL_SNAPSHOT, (json.dumps(state, ensure_ascii=False), seq, user_id))
+            _tail[user_id] = 0
+
+
+def load_post_history(post_id: int) -> list[tuple[str, str | None, float]]:
+    """История правок черновика отправленного поста: (поле, JSON значения или None, время)."""
+    return _get_reader().execute(
+        "SELECT key, value, created_at FROM draft_journal WHERE post_id=? ORDER BY seq",
+        (post_id,),
+    ).fetchall()
+
+
+def _forget_draft(user_id: int):
+    _known.pop(user_id, None)
+    _tail.pop(user_id, None)
+    _to_compact.discard(user_id)
+
+
+def _delete_draft(con: sqlite3.Connection, user_id: int):
+    con.execute(_SQL_DELETE, (user_id,))
+    con.execute(_SQL_JOURNAL_DELETE, (user_id,))
+    _forget_draft(user_id)
+
+
+def delete_draft(user_id: int):
+    with _transaction() as con:
+        _delete_draft(con, user_id)
+
+
+def expire_drafts(older_than: float, limit: int) -> list[int]:
+    """
+    Удаляет до limit черновиков, не менявшихся с момента older_than.
+    Пачка маленькая, чтобы блокировка записи держалась недолго.
+    """
+    with _transaction() as con:
+        user_ids = [
+            row[0] for row in con.execute(
+                "SELECT user_id FROM drafts WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+                (older_than, limit),
+            )
+        ]
+        for user_id in user_ids:
+            _delete_draft(con, user_id)
+    return user_ids
+
+
+# ----------------- Очередь модерации -----------------
+POST_PENDING = "pending"
+POST_APPROVED = "approved"
+POST_REJECTED = "rejected"
+POST_PUBLISHED = "published"
+
+
+def submit_post(user_id: int, data: str) -> int:
+    """
+    Переносит черновик в очередь модерации. Возвращает post_id.
+    Журнал черновика не удаляется: его записи привязываются к посту.
+    """
+    now = time.time()
+    try:
+        with _transaction() as con:
+            post_id = con.execute(
+                "INSERT INTO moderation_queue (user_id, status, data, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, POST_PENDING, data, now, now),
+            ).lastrowid
+            # правки, ещё ждавшие write-behind, тоже попадают в историю
+            _write_changes(con, user_id, data, now)
+            con.execute(
+                "UPDATE draft_journal SET post_id=? WHERE user_id=? AND post_id IS NULL",
+                (post_id, user_id),
+            )
+            con.execute(_SQL_DELETE, (user_id,))
+    finally:
+        _forget_draft(user_id)
+    return post_id
+
+
+def set_moderation_message(post_id: int, chat_id: int, message_id: int, post_message_ids: list[int]):
+    with _lock:
+        _get_con().execute(
+            "UPDATE moderation_queue SET mod_chat_id=?, mod_message_id=?, mod_post_ids=? "
+            "WHERE post_id=?",
+            (chat_id, message_id, json.dumps(post_message_ids), post_id),
+        )
+
+
+def load_post(post_id: int) -> dict | None:
+    row = _get_reader().execute(
+        "SELECT post_id, user_id, status, data, mod_chat_id, mod_message_id, created_at "
+        "FROM moderation_queue WHERE post_id=?",
+        (post_id,),
+    ).fetchone()
+    if not row:
+        return None
+    keys = ("post_id", "user_id", "status", "data", "mod_chat_id", "mod_message_id", "created_at")
+    return dict(zip(keys, row))
+
+
+def set_post_status(post_id: int, status: str, expected: str = POST_PENDING) -> bool:
+    """Меняет статус, только если пост всё ещё в статусе expected (защита от двойного нажатия)."""
+    with _lock:
+        cur = _get_con().execute(
+            "UPDATE moderation_queue SET status=?, updated_at=? WHERE post_id=? AND status=?",
+            (status, time.time(), post_id, expected),
         )
-        con.commit()
+    return cur.rowcount == 1
+
+
+def reject_posts(post_ids: list[int]) -> list[tuple[int, int, int | None, int | None]]:
+    """
+    pending → rejected для пачки постов одной транзакцией.
+    Возвращает (post_id, user_id, mod_chat_id, mod_message_id) отклонённых.
+    """
+    now = time.time()
+    rejected = []
+    with _transaction() as con:
+        for post_id in post_ids:
+            row = con.execute(
+                "SELECT post_id, user_id, mod_chat_id, mod_message_id FROM moderation_queue "
+                "WHERE post_id=? AND status=?",
+                (post_id, POST_PENDING),
+            ).fetchone()
+            if row:
+                con.execute(
+                    "UPDATE moderation_queue SET status=?, updated_at=? WHERE post_id=?",
+                    (POST_REJECTED, now, post_id),
+                )
+                rejected.append(row)
+    return rejected
+
+
+def list_pending_posts(limit: int) -> tuple[int, list[tuple[int, str]]]:
+    """Сколько постов ждут модерации и первые limit из них: (post_id, data)."""
+    con = _get_reader()
+    total = con.execute(
+        "SELECT COUNT(*) FROM moderation_queue WHERE status=?", (POST_PENDING,)
+    ).fetchone()[0]
+    rows = con.execute(
+        "SELECT post_id, data FROM moderation_queue WHERE status=? ORDER BY created_at LIMIT ?",
+        (POST_PENDING, limit),
+    ).fetchall()
+    return total, rows
 
-def load_draft(user_id: int) -> str | None:
-    with closing(sqlite3.connect(DB_PATH)) as con:
+
+def archive_post(post_id: int, channel_id: int | None, channel_message_ids: list[int]):
+    """
+    Записывает опубликованный пост в archive и помечает его в очереди как
+    published — одной транзакцией, чтобы пост не потерялся между таблицами.
+    """
+    now = time.time()
+    with _transaction() as con:
         row = con.execute(
-            "SELECT data FROM drafts WHERE user_id=?",
-            (user_id,),
+            "SELECT user_id, data, created_at FROM moderation_queue WHERE post_id=?",
+            (post_id,),
         ).fetchone()
-        return row[0] if row else None
+        if not row:
+            return
+        user_id, data, submitted_at = row
+        data = json.loads(data)
+        temp = data.get("temp")
+        con.execute(
+            "INSERT OR REPLACE INTO archive (post_id, user_id, author, location, point_types, "
+            "fish_type, fishing_type, fishing_extra, coords, temp, comment, photo_unique_ids, "
+            "channel_id, channel_message_ids, submitted_at, published_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                post_id, user_id,
+                data.get("author"),
+                data.get("location"),
+                ",".join(data.get("point_types") or []),
+                data.get("fish_type"),
+                data.get("fishing_type"),
+                data.get("fishing_extra"),
+                data.get("coords"),
+                temp if temp not in (None, "skip") else None,
+                data.get("comment"),
+                json.dumps(data.get("photo_uids") or []),
+                channel_id,
+                json.dumps(channel_message_ids),
+                submitted_at, now,
+            ),
+        )
+        con.execute(
+            "UPDATE moderation_queue SET status=?, updated_at=? WHERE post_id=?",
+            (POST_PUBLISHED, now, post_id),
+        )
+        con.execute("DELETE FROM publish_outbox WHERE post_id=?", (post_id,))
 
-def delete_draft(user_id: int):
-    with closing(sqlite3.connect(DB_PATH)) as con:
-        con.execute("DELETE FROM drafts WHERE user_id=?", (user_id,))
-        con.commit()
+
+# ----------------- Очередь публикации -----------------
+_OUTBOX_KEYS = (
+    "post_id", "user_id", "data", "mod_chat_id", "mod_message_id", "mod_post_ids", "attempts",
+    "channel_id", "channel_message_ids",
+)
+
+
+def _approve(con: sqlite3.Connection, post_id: int, now: float) -> bool:
+    cur = con.execute(
+        "UPDATE moderation_queue SET status=?, updated_at=? WHERE post_id=? AND status=?",
+        (POST_APPROVED, now, post_id, POST_PENDING),
+    )
+    if cur.rowcount != 1:
+        return False
+    con.execute(
+        "INSERT OR IGNORE INTO publish_outbox (post_id, next_attempt_at, created_at) "
+        "VALUES (?, ?, ?)",
+        (post_id, now, now),
+    )
+    return True
+
+
+def approve_post(post_id: int) -> bool:
+    """
+    pending → approved и задача в publish_outbox — одной транзакцией:
+    одобренный пост либо ждёт публикации, либо не одобрен вовсе.
+    """
+    with _transaction() as con:
+        return _approve(con, post_id, time.time())
+
+
+def approve_posts(post_ids: list[int]) -> list[int]:
+    """То же для пачки постов (одна транзакция). Возвращает одобренные post_id."""
+    now = time.time()
+    with _transaction() as con:
+        return [post_id for post_id in post_ids if _approve(con, post_id, now)]
+
+
+def claim_publications(limit: int, lease: float) -> list[dict]:
+    """
+    Забирает до limit задач, срок которых подошёл, и откладывает их на lease
+    секунд: если процесс упадёт посреди отправки, задача вернётся сама.
+    Задачи постов, которые уже не в статусе approved (опубликованы, удалены),
+    выбрасываются — повторной публикации не будет.
+    """
+    now = time.time()
+    with _transaction() as con:
+        con.execute(
+            "DELETE FROM publish_outbox WHERE post_id NOT IN "
+            "(SELECT post_id FROM moderation_queue WHERE status=?)",
+            (POST_APPROVED,),
+        )
+        rows = con.execute(
+            "SELECT o.post_id, q.user_id, q.data, q.mod_chat_id, q.mod_message_id, q.mod_post_ids, "
+            "o.attempts, o.channel_id, o.channel_message_ids "
+            "FROM publish_outbox o JOIN moderation_queue q ON q.post_id = o.post_id "
+            "WHERE o.next_attempt_at <= ? ORDER BY o.next_attempt_at LIMIT ?",
+            (now, limit),
+        ).fetchall()
+        con.executemany(
+            "UPDATE publish_outbox SET next_attempt_at=? WHERE post_id=?",
+            [(now + lease, row[0]) for row in rows],
+        )
+    return [dict(zip(_OUTBOX_KEYS, row)) for row in rows]
+
+
+def mark_published(post_id: int, channel_id: int | None, channel_message_ids: list[int]):
+    """Пост уже в канале: дальше задача только архивирует его, не отправляет."""
+    with _lock:
+        _get_con().execute(
+            "UPDATE publish_outbox SET channel_id=?, channel_message_ids=? WHERE post_id=?",
+            (channel_id, json.dumps(channel_message_ids), post_id),
+        )
+
+
+def retry_publication(post_id: int, delay: float, error: str):
+    with _lock:
+        _get_con().execute(
+            "UPDATE publish_outbox SET attempts=attempts+1, next_attempt_at=?, last_error=? "
+            "WHERE post_id=?",
+            (time.time() + delay, error, post_id),
+        )
+
+
+def abandon_publication(post_id: int):
+    """Снимает задачу и возвращает пост модераторам (approved → pending)."""
+    with _transaction() as con:
+        con.execute("DELETE FROM publish_outbox WHERE post_id=?", (post_id,))
+        con.execute(
+            "UPDATE moderation_queue SET status=?, updated_at=? WHERE post_id=? AND status=?",
+            (POST_PENDING, time.time(), post_id, POST_APPROVED),
+        )
+
+
+# ----------------- Состояние Application (persistence.py) -----------------
+def save_ptb_state(
+    user_data: dict[int, str | None],
+    chat_data: dict[int, str | None],
+    bot_data: str | None,
+    conversations: dict[tuple[str, str], str | None],
+):
+    """Пишет накопленные изменения одной транзакцией. None — удалить запись."""
+    with _transaction() as con:
+        for table, column, items in (
+            ("ptb_user_data", "user_id", user_data),
+            ("ptb_chat_data", "chat_id", chat_data),
+        ):
+            con.executemany(
+                f"REPLACE INTO {table} ({column}, data) VALUES (?, ?)",
+                [(k, v) for k, v in items.items() if v is not None],
+            )
+            con.executemany(
+                f"DELETE FROM {table} WHERE {column}=?",
+                [(k,) for k, v in items.items() if v is None],
+            )
+        if bot_data is not None:
+            con.execute("REPLACE INTO ptb_bot_data (id, data) VALUES (0, ?)", (bot_data,))
+        con.executemany(
+            "REPLACE INTO ptb_conversations (name, key, state) VALUES (?, ?, ?)",
+            [(name, key, v) for (name, key), v in conversations.items() if v is not None],
+        )
+        con.executemany(
+            "DELETE FROM ptb_conversations WHERE name=? AND key=?",
+            [(name, key) for (name, key), v in conversations.items() if v is None],
+        )
+
+
+def load_ptb_user_data(user_id: int) -> str | None:
+    row = _get_reader().execute(
+        "SELECT data FROM ptb_user_data WHERE user_id=?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_ptb_chat_data(chat_id: int) -> str | None:
+    row = _get_reader().execute(
+        "SELECT data FROM ptb_chat_data WHERE chat_id=?", (chat_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_ptb_bot_data() -> str | None:
+    row = _get_reader().execute("SELECT data FROM ptb_bot_data WHERE id=0").fetchone()
+    return row[0] if row else None
+
+
+def load_ptb_conversations(name: str) -> list[tuple[str, str]]:
+    return _get_reader().execute(
+        "SELECT key, state FROM ptb_conversations WHERE name=?", (name,)
+    ).fetchall()
+
+
+# ----------------- Служебные значения -----------------
+def save_update_hwm(update_id: int):
+    with _lock:
+        _get_con().execute(
+            "REPLACE INTO bot_state (key, value) VALUES ('update_hwm', ?)", (update_id,)
+        )
+
+
+def load_update_hwm() -> int | None:
+    row = _get_reader().execute("SELECT value FROM bot_state WHERE key='update_hwm'").fetchone()
+    return row[0] if row else None
+
+
+# ----------------- Async API для обработчиков -----------------
+async def _run(executor: ThreadPoolExecutor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def run_write(func, *args):
+    """Выполняет func на потоке-писателе."""
+    return await _run(_writer, func, *args)
+
+
+async def run_read(func, *args):
+    """Выполняет func в пуле читателей."""
+    return await _run(_reader_pool, func, *args)
+
+
+def _start_flush():
+    task = asyncio.get_running_loop().create_task(flush_drafts())
+    # loop держит на задачи только слабые ссылки — без своей её может собрать GC
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_tasks.discard)
+
+
+def _schedule_flush():
+    global _flush_handle
+    if _flush_handle is None:
+        _flush_handle = asyncio.get_running_loop().call_later(FLUSH_DELAY, _start_flush)
+
+
+async def flush_drafts():
+    """Записывает все отложенные черновики. Вызывать перед чтением из БД и при остановке."""
+    global _flush_handle
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    if not _pending:
+        return
+    items = list(_pending.items())
+    _writing.update(_pending)
+    _pending.clear()
+    try:
+        await _run(_writer, save_drafts, items)
+    except Exception:
+        # не теряем: назад в очередь всё, что не заменено новой версией и
+        # не отправлено/удалено, пока шла запись
+        retry = {
+            user_id: data for user_id, data in items
+            if _writing.get(user_id) is data and user_id not in _pending
+        }
+        _pending.update(retry)
+        logger.exception("Черновики не записаны, повтор через %s с: %s шт.", FLUSH_DELAY, len(retry))
+        if retry:
+            _schedule_flush()
+    else:
+        if _to_compact:
+            _writer.submit(compact_drafts)
+    finally:
+        for user_id, data in items:
+            if _writing.get(user_id) is data:
+                del _writing[user_id]
+
+
+async def save_draft_async(user_id: int, data: str):
+    _pending[user_id] = data
+    _schedule_flush()
+
+
+async def submit_post_async(user_id: int, data: str) -> int:
+    _pending.pop(user_id, None)
+    _writing.pop(user_id, None)
+    return await _run(_writer, submit_post, user_id, data)
+
+
+async def delete_draft_async(user_id: int):
+    _pending.pop(user_id, None)
+    _writing.pop(user_id, None)
+    await _run(_writer, delete_draft, user_id)
@@ -0,0 +1,73 @@
+import logging
+
+from database import run_write, save_update_hwm
+
+logger = logging.getLogger(__name__)
+
+# ---------- Повторная доставка апдейтов ----------
+# Если бот ответил на вебхук слишком поздно, Telegram присылает тот же
+# апдейт ещё раз: фото добавлялось дважды, пост мог уйти в канал повторно.
+# UpdateDedup помнит последние DEDUP_SIZE update_id в кольцевом буфере
+# (проверка и вставка — O(1)), и PerUserUpdateProcessor отбрасывает
+# повтор до того, как он дойдёт до обработчиков.
+# После перезапуска кольцо пустое, поэтому в БД хранится high-water mark:
+# update_id, до которого включительно всё уже обработано. Апдейты из окна
+# (hwm - DEDUP_SIZE, hwm] после старта считаются повторами. Окно, а не
+# «всё, что ≤ hwm»: после недели тишины Telegram начинает нумерацию со
+# случайного числа.
+
+DEDUP_SIZE = 4096
+
+
+class UpdateDedup:
+    __slots__ = ("_ring", "_pos", "_seen", "_in_flight", "_max_seen", "_restored", "_saved")
+
+    def __init__(self, size: int = DEDUP_SIZE):
+        self._ring: list[int | None] = [None] * size
+        self._pos = 0
+        self._seen: set[int] = set()
+        self._in_flight: set[int] = set()
+        self._max_seen: int | None = None
+        self._restored: tuple[int, int] | None = None   # (low, high] — обработано до рестарта
+        self._saved: int | None = None
+
+    def restore(self, hwm: int | None):
+        if hwm is not None:
+            self._restored = (hwm - len(self._ring), hwm)
+            self._saved = hwm
+
+    def start(self, update_id: int) -> bool:
+        """True — апдейт новый (и теперь запомнен), False — повтор."""
+        if update_id in self._seen:
+            return False
+        if self._restored and self._restored[0] < update_id <= self._restored[1]:
+            return False
+        old = self._ring[self._pos]
+        if old is not None:
+            self._seen.discard(old)
+        self._ring[self._pos] = update_id
+        self._pos = (self._pos + 1) % len(self._ring)
+        self._seen.add(update_id)
+        self._in_flight.add(update_id)
+        if self._max_seen is None or update_id > self._max_seen:
+            self._max_seen = update_id
+        return True
+
+    def done(self, update_id: int):
+        self._in_flight.discard(update_id)
+
+    @property
+    def high_water_mark(self) -> int | None:
+        # то, что ещё обрабатывается, в hwm не попадает: после падения его
+        # повторная доставка должна пройти
+        if self._in_flight:
+            return min(self._in_flight) - 1
+        return self._max_seen
+
+    async def save(self):
+        """Пишет hwm в БД, если он сдвинулся (вызывается из JobQueue и при остановке)."""
+        hwm = self.high_water_mark
+        if hwm is None or hwm == self._saved:
+            return
+        await run_write(save_update_hwm, hwm)
+        self._saved = hwm
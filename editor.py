@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from telegram import CallbackQuery, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ---------- Правка сообщений без пустых запросов ----------
+# Для каждого чата помним последнее показанное сообщение мастера: его id,
+# хэш текста и клавиатуру. Если экран не изменился (повторно нажали уже
+# выбранный водоём или температуру), запрос к Bot API не отправляется —
+# раньше он стоил round trip и заканчивался "Message is not modified".
+# Клавиатуры из реестра (keyboards.py) — одни и те же объекты, поэтому
+# сравнение обычно сводится к `is`.
+
+EDIT_CACHE_SIZE = 10_000
+TOGGLE_QUIET = 0.4    # сек тишины, после которых уходит отложенная правка (edit_soon)
+_NO_TEXT = object()   # текст неизвестен (правили только клавиатуру)
+
+_last: OrderedDict[int, tuple[int, object, InlineKeyboardMarkup | None]] = OrderedDict()
+_soon: dict[int, list] = {}   # chat_id -> [message_id, TimerHandle, Task | None] отложенной правки
+_tasks: set[asyncio.Task] = set()   # запущенные отложенные правки
+# Номер последней начатой правки в чате: правка, пока ждала ответа Telegram,
+# могла устареть (началась другая) — тогда её результат в кэш не пишется.
+_gen: dict[int, int] = {}
+
+
+def _same_markup(a, b) -> bool:
+    return a is b or a == b
+
+
+def _remember(chat_id: int, message_id: int, text_hash, markup):
+    _last[chat_id] = (message_id, text_hash, markup)
+    _last.move_to_end(chat_id)
+    if len(_last) > EDIT_CACHE_SIZE:
+        old, _ = _last.popitem(last=False)
+        _gen.pop(old, None)
+
+
+def _begin(chat_id: int) -> int:
+    _gen[chat_id] = _gen.get(chat_id, 0) + 1
+    return _gen[chat_id]
+
+
+def _cached(message: Message | None):
+    if message is None:
+        return None
+    hit = _last.get(message.chat_id)
+    if hit is None or hit[0] != message.message_id:
+        return None
+    return hit
+
+
+def _cancel_soon(message: Message | None) -> asyncio.Task | None:
+    """
+    Отложенная правка этого сообщения больше не нужна: его правят сейчас.
+    Ещё не ушла — отменяется; уже в полёте — возвращается, чтобы её дождаться.
+    """
+    if message is None:
+        return None
+    pending = _soon.get(message.chat_id)
+    if not pending or pending[0] != message.message_id or pending[2] is asyncio.current_task():
+        return None
+    del _soon[message.chat_id]
+    pending[1].cancel()
+    return pending[2]
+
+
+async def _settle(message: Message | None):
+    """Перед обычной правкой: старая клавиатура не должна лечь поверх нового экрана."""
+    task = _cancel_soon(message)
+    if task is not None:
+        await asyncio.wait({task})
+
+
+def _not_modified(e: BadRequest) -> bool:
+    return "not modified" in str(e)
+
+
+def remember(message: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None):
+    """Запомнить только что отправленное сообщение."""
+    _begin(message.chat_id)
+    _remember(message.chat_id, message.message_id, hash(text), reply_markup)
+
+
+def forget(chat_id: int):
+    """Диалог в чате закончился (отмена, истёкший черновик): забыть экран и отложенную правку."""
+    _last.pop(chat_id, None)
+    _gen.pop(chat_id, None)
+    pending = _soon.pop(chat_id, None)
+    if pending:
+        pending[1].cancel()
+        if pending[2] is not None:
+            pending[2].cancel()
+
+
+async def edit_text(q: CallbackQuery, text: str, reply_markup: InlineKeyboardMarkup | None = None,
+                    **kwargs) -> bool:
+    """
+    edit_message_text, который не ходит в Telegram, если текст и клавиатура
+    те же. Возвращает False, если править было нечего.
+    """
+    message = q.message
+    await _settle(message)
+    text_hash = hash(text)
+    hit = _cached(message)
+    if hit and hit[1] == text_hash and _same_markup(hit[2], reply_markup):
+        return False
+    gen = _begin(message.chat_id) if message is not None else None
+    try:
+        await q.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if not _not_modified(e):
+            raise
+    if message is not None and _gen.get(message.chat_id) == gen:
+        _remember(message.chat_id, message.message_id, text_hash, reply_markup)
+    return True
+
+
+async def edit_markup(q: CallbackQuery, reply_markup: InlineKeyboardMarkup | None) -> bool:
+    """То же для edit_message_reply_markup."""
+    message = q.message
+    await _settle(message)
+    hit = _cached(message)
+    if hit and _same_markup(hit[2], reply_markup):
+        return False
+    gen = _begin(message.chat_id) if message is not None else None
+    try:
+        await q.edit_message_reply_markup(reply_markup=reply_markup)
+    except BadRequest as e:
+        if not _not_modified(e):
+            raise
+    # hit прочитан до запроса: он ещё верен, только если правок после не начиналось
+    if message is not None and _gen.get(message.chat_id) == gen:
+        _remember(message.chat_id, message.message_id, hit[1] if hit else _NO_TEXT, reply_markup)
+    return True
+
+
+# ---------- Отложенная правка для кнопок-переключателей ----------
+# Пользователь, который быстро щёлкает водоёмы или типы точки, раньше
+# получал по правке сообщения на каждое нажатие — Telegram начинал отвечать
+# flood wait. edit_soon откладывает правку на TOGGLE_QUIET: каждое новое
+# нажатие переносит её, и уходит только последний экран. Если он совпал с
+# уже показанным (включили и выключили), запроса не будет вовсе — это
+# отсеет кэш выше. Любая обычная правка того же сообщения (переход на
+# другой шаг) отменяет отложенную, а если та уже ушла в Telegram — сначала
+# дожидается её ответа.
+
+def edit_soon(q: CallbackQuery, text: str | None = None,
+              reply_markup: InlineKeyboardMarkup | None = None, **kwargs):
+    """edit_text (или edit_markup, если text=None) после паузы в нажатиях."""
+    message = q.message
+    if message is None:
+        # inline-сообщение: ключа для отложенной правки нет, правим сразу
+        _start(_edit(q, text, reply_markup, kwargs))
+        return
+    previous = _cancel_soon(message)
+    pending = [message.message_id, None, None]
+
+    def fire():
+        pending[2] = _start(_flush(pending, previous, q, text, reply_markup, kwargs))
+
+    pending[1] = asyncio.get_running_loop().call_later(TOGGLE_QUIET, fire)
+    _soon[message.chat_id] = pending
+
+
+def _start(coro) -> asyncio.Task:
+    task = asyncio.get_running_loop().create_task(coro)
+    # loop держит на задачи только слабые ссылки — без своей её может собрать GC
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def _flush(pending: list, previous: asyncio.Task | None, q: CallbackQuery, text,
+                 reply_markup, kwargs):
+    # пока правка в полёте, она остаётся в _soon: обычная правка её дождётся
+    if previous is not None:
+        await asyncio.wait({previous})
+    try:
+        await _edit(q, text, reply_markup, kwargs)
+    finally:
+        if _soon.get(q.message.chat_id) is pending:
+            del _soon[q.message.chat_id]
+
+
+async def _edit(q: CallbackQuery, text, reply_markup, kwargs):
+    try:
+        if text is None:
+            await edit_markup(q, reply_markup)
+        else:
+            await edit_text(q, text, reply_markup, **kwargs)
+    except TelegramError as e:
+        logger.warning("Отложенная правка сообщения не удалась: %s", e)
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+from typing import Awaitable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# ---------- Параллельные независимые вызовы ----------
+# Уведомить автора, поправить сообщение в модераторской и т.п. — вызовы,
+# которым незачем ждать друг друга. fan_out запускает их одновременно (не
+# больше limit сразу) и собирает итог по каждому: ошибка одного вызова не
+# отменяет остальные. Если порядок важен (альбом, потом сообщение с
+# кнопками), такие шаги идут одной корутиной — внутри она последовательна.
+
+FANOUT_LIMIT = 4
+
+
+class Outcome(NamedTuple):
+    value: object = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def fan_out(calls: dict[str, Awaitable], limit: int = FANOUT_LIMIT,
+                  label: str = "fan_out") -> dict[str, Outcome]:
+    """
+    calls — {имя: корутина}. Возвращает {имя: Outcome} в том же порядке.
+    Неудачные вызовы пишутся в лог с именем, исключения наружу не идут.
+    """
+    sem = asyncio.Semaphore(limit)
+
+    async def run(name: str, call: Awaitable) -> Outcome:
+        async with sem:
+            try:
+                return Outcome(await call)
+            except Exception as e:
+                logger.warning("%s: %s — ошибка: %s", label, name, e)
+                return Outcome(error=e)
+
+    results = await asyncio.gather(*(run(name, call) for name, call in calls.items()))
+    return dict(zip(calls, results))
@@ -1,18 +1,34 @@
 import logging
 import json
 import os
-from telegram import Update, InputMediaPhoto, InlineKeyboardMarkup, InlineKeyboardButton
+import re
+import time
+from html import escape
+from itertools import combinations
+from telegram import Update, InputMediaPhoto
 from telegram.ext import (
-    ConversationHandler, CommandHandler, CallbackQueryHandler,
+    ConversationHandler, CommandHandler,
     MessageHandler, ContextTypes, filters
 )
 from keyboards import (
-    make_location_kb, make_point_type_kb, make_fish_type_kb,
-    make_fishing_type_kb, make_coordinates_kb, make_temp_kb,
-    make_confirm_kb, make_moderation_kb
+    make_greeting_kb, make_location_kb, make_point_type_kb, make_fish_type_kb,
+    make_fishing_type_kb, make_temp_kb, make_comment_kb,
+    make_confirm_kb, make_moderation_kb, make_queue_kb, queue_selection, registered_callback_data,
+    POINT_TYPES, POINT_TYPES_MAX, FISHES, FISH_CUSTOM, FISHING_TYPES, TEMPS,
 )
-
-from database import save_draft, load_draft, delete_draft
+from callbacks import CallbackRouter, check_routes, decode, encode
+from database import (
+    save_draft_async, submit_post_async, flush_drafts, run_read, run_write,
+    expire_drafts, load_post, set_moderation_message, set_post_status, approve_post,
+    approve_posts, reject_posts, list_pending_posts, load_post_history, delete_draft_async,
+    POST_REJECTED,
+)
+from editor import edit_text, forget
+from fanout import fan_out
+from locations import ALL_LOCATIONS
+from publisher import kick
+from render import build_post_text
+from wizard import Step, Wizard
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -51,244 +67,16 @@ def _mod_chat_id():
     return int(v) if v else None
 
 
-# ----------------- Утилиты навигации -----------------
-def nav_kb_row(back: str | None = None, nxt: str | None = None):
-    """Возвращает строку кнопок навигации (неполная клавиатура)."""
-    row = []
-    if back:
-        row.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"go_back:{back}"))
-    if nxt:
-        row.append(InlineKeyboardButton("➡️ Далее", callback_data=f"go_next:{nxt}"))
-    return row
-
-def attach_nav(kb: InlineKeyboardMarkup | None, back: str | None = None, nxt: str | None = None) -> InlineKeyboardMarkup:
-    """
-    Приклеивает строку навигации к существующей InlineKeyboardMarkup.
-    Если kb is None — создаёт только навигацию.
-    """
-    nav_row = nav_kb_row(back, nxt)
-    if not nav_row:
-        return kb or InlineKeyboardMarkup([])
-    if kb is None:
-        return InlineKeyboardMarkup([nav_row])
-    # kb.inline_keyboard — list[list[InlineKeyboardButton]]
-    buttons = [list(row) for row in kb.inline_keyboard]
-    buttons.append(nav_row)
-    return InlineKeyboardMarkup(buttons)
-
-
-# Когда возвращаемся назад — нужно удалить данные шага, который нас уходит (чтобы не сохранять)
-# mapping: target_step -> key_to_delete (это ключ данных *следующего* шага, который мы очищаем)
-_delete_after_map = {
-    "LOCATION": "point_types",
-    "POINT_TYPE": "fish",
-    "FISH_TYPE": "fishing",
-    "FISHING_TYPE": "fishing_extra",
-    "DETAIL": "coords",
-    "COORDS": "temp",
-    "TEMP": "photos",
-    "PHOTOS": "comment",
-    "COMMENT": "author",
-    "AUTHOR": None,
-}
-
-
-# ----------------- Навигационные обработчики -----------------
-async def go_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    parts = q.data.split(":", 1)
-    if len(parts) < 2:
-        return ConversationHandler.END
-    target = parts[1]
-
-    # Удаляем данные следующего шага (чтобы "Назад" отменял данные шага, с которого уходим)
-    key_to_delete = _delete_after_map.get(target)
-    if key_to_delete and key_to_delete in context.user_data:
-        del context.user_data[key_to_delete]
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-    # Отправляем соответствующий экран (в точности как в оригинальном flow)
-    if target == "LOCATION":
-        await q.edit_message_text("🎣 Шаг 1: Выберите водоём:", reply_markup=attach_nav(make_location_kb(), None, "POINT_TYPE"))
-        return LOCATION
-
-    if target == "POINT_TYPE":
-        # повторить точную клавиатуру с отметками, если есть
-        chosen = context.user_data.get("point_types", [])
-        await q.edit_message_text("Шаг 2: Выберите тип точки:", reply_markup=attach_nav(make_point_type_kb(chosen), "LOCATION", None))
-        return POINT_TYPE
-
-    if target == "FISH_TYPE":
-        await q.edit_message_text("🎣 Шаг 3: Выберите вид рыбы:", reply_markup=attach_nav(make_fish_type_kb(), "POINT_TYPE", None))
-        return FISH_TYPE
-
-    if target == "FISHING_TYPE":
-        await q.edit_message_text("Шаг 4: Выберите тип ловли:", reply_markup=attach_nav(make_fishing_type_kb(), "FISH_TYPE", None))
-        return FISHING_TYPE
-
-    if target == "DETAIL":
-        # экран ввода дополнительного параметра
-        await q.edit_message_text("Шаг 4.1: Введите параметр:", reply_markup=attach_nav(None, "FISHING_TYPE", "COORDS"))
-        return DETAIL
-
-    if target == "TEMP":
-        await q.edit_message_text("Шаг 6: Температура:", reply_markup=attach_nav(make_temp_kb(), "COORDS", None))
-        return TEMP
-
-    if target == "PHOTOS":
-        text = (
-            "Шаг 7: Загрузите не больше 10 скриншотов.\n\n"
-            "📸 Скриншоты должны отображать:\n"
-            "• место ловли\n• садок\n• прикорм\n• карту\n• сборку\n\n"
-            "Отправляйте скриншоты как обычные сообщения.\n"
-            "Фотографии мониторов не принимаются .\n"
-            "Когда закончите, нажмите кнопку «Далее» ."
-        )
-        # оригинально ты показывал кнопку "Далее" — сохраним её и добавим Back
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Далее", callback_data="photos_done")]])
-        kb = attach_nav(kb, "TEMP", "COMMENT")
-        await q.edit_message_text(text, reply_markup=kb)
-        return PHOTOS
-
-    if target == "COMMENT":
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Пропустить", callback_data="skip_comment")]])
-        kb = attach_nav(kb, "PHOTOS", "AUTHOR")
-        await q.edit_message_text("Шаг 8: Добавьте комментарий или нажмите «Пропустить».", reply_markup=kb)
-        return COMMENT
-
-    if target == "AUTHOR":
-        kb = attach_nav(None, "COMMENT", "PREVIEW")
-        await q.edit_message_text("Шаг 9: Укажите свой игровой ник:", reply_markup=kb)
-        return AUTHOR
+# Экраны, переходы «Назад / Далее» и ключи черновика, которые стираются при
+# возврате, описаны таблицей шагов в конце файла (wizard = Wizard([...])).
+# Ниже — только то, что у шага своё: выбор вариантов и ввод текста.
 
-    if target == "PREVIEW":
-        text = build_post_text(context.user_data)
-        kb = make_confirm_kb()
-        kb = attach_nav(kb, "AUTHOR", None)
-        await q.edit_message_text("Шаг 10: Предпросмотр:\n\n" + text, reply_markup=kb)
-        return PREVIEW
-
-    return ConversationHandler.END
-
-
-async def go_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    parts = q.data.split(":", 1)
-    if len(parts) < 2:
-        return ConversationHandler.END
-    target = parts[1]
-
-    # Перейти к следующему экрану (без сохранения/изменения данных — просто навигация)
-    if target == "POINT_TYPE":
-        await q.edit_message_text("Шаг 2: Выберите тип точки:", reply_markup=attach_nav(make_point_type_kb(), "LOCATION", None))
-        return POINT_TYPE
-
-    if target == "FISH_TYPE":
-        await q.edit_message_text("🎣 Шаг 3: Выберите вид рыбы:", reply_markup=attach_nav(make_fish_type_kb(), "POINT_TYPE", None))
-        return FISH_TYPE
-
-    if target == "FISHING_TYPE":
-        await q.edit_message_text("Шаг 4: Выберите тип ловли:", reply_markup=attach_nav(make_fishing_type_kb(), "FISH_TYPE", None))
-        return FISHING_TYPE
-
-    if target == "DETAIL":
-        await q.edit_message_text("Шаг 4.1: Введите параметр:", reply_markup=attach_nav(None, "FISHING_TYPE", "COORDS"))
-        return DETAIL
-
-    if target == "TEMP":
-        await q.edit_message_text("Шаг 6: Температура:", reply_markup=attach_nav(make_temp_kb(), "COORDS", None))
-        return TEMP
-
-    if target == "PHOTOS":
-        text = (
-            "Шаг 7: Загрузите не больше 10 скриншотов.\n\n"
-            "📸 Скриншоты должны отображать:\n"
-            "• место ловли\n• садок\n• прикорм\n• карту\n• сборку\n\n"
-            "Отправляйте скриншоты как обычные сообщения.\n"
-            "Фотографии мониторов не принимаются .\n"
-            "Когда закончите, нажмите кнопку «Далее» ."
-        )
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Далее", callback_data="photos_done")]])
-        kb = attach_nav(kb, "TEMP", "COMMENT")
-        await q.edit_message_text(text, reply_markup=kb)
-        return PHOTOS
-
-    if target == "COMMENT":
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Пропустить", callback_data="skip_comment")]])
-        kb = attach_nav(kb, "PHOTOS", "AUTHOR")
-        await q.edit_message_text("Шаг 8: Добавьте комментарий или нажмите «Пропустить».", reply_markup=kb)
-        return COMMENT
-
-    if target == "AUTHOR":
-        await q.edit_message_text("Шаг 9: Укажите свой игровой ник:", reply_markup=attach_nav(None, "COMMENT", "PREVIEW"))
-        return AUTHOR
-
-    if target == "PREVIEW":
-        text = build_post_text(context.user_data)
-        kb = make_confirm_kb()
-        kb = attach_nav(kb, "AUTHOR", None)
-        await q.edit_message_text("Шаг 10: Предпросмотр:\n\n" + text, reply_markup=kb)
-        return PREVIEW
-
-    return ConversationHandler.END
-
-
-# --------------------- Шаг 7. Фото (без изменений логики) ---------------------
-async def photo_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Принимает до 10 изображений. Учитывает как обычные фото, так и документы
-    с изображениями (если Telegram отправил фото как файл).
-    """
-    if not isinstance(context.user_data.get("photos"), list):
-        context.user_data["photos"] = []
-    photos = context.user_data["photos"]
-
-    # --- Получаем file_id для фото или документа-картинки ---
-    file_id = None
-    if update.message:
-        if update.message.photo:
-            # обычное фото
-            file_id = update.message.photo[-1].file_id
-        elif update.message.document and update.message.document.mime_type.startswith("image/"):
-            # изображение, отправленное как документ
-            file_id = update.message.document.file_id
-
-    # Если это не картинка — выходим
-    if not file_id:
-        return PHOTOS
-
-    # --- Сохраняем, если нет дубля и не превышен лимит ---
-    if file_id not in photos:
-        if len(photos) >= 10:
-            kb = InlineKeyboardMarkup([[InlineKeyboardButton("Далее", callback_data="photos_done")]])
-            kb = attach_nav(kb, "TEMP", "COMMENT")
-            await update.message.reply_text(
-                "📸 Вы уже загрузили максимум 10 фото.\nНажмите «Далее», чтобы перейти к следующему шагу.",
-                reply_markup=kb,
-            )
-            return PHOTOS
-
-        photos.append(file_id)
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-    # --- Ответ пользователю ---
-    kb = InlineKeyboardMarkup([[InlineKeyboardButton("Далее", callback_data="photos_done")]])
-    kb = attach_nav(kb, "TEMP", "COMMENT")
-    await update.message.reply_text(
-        f"Фото сохранено ({len(photos)}/10).\nОтправьте ещё фото или нажмите «Далее».",
-        reply_markup=kb,
-    )
-    return PHOTOS
-
-
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
 # --------------------- Старт ---------------------
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message:
         return GREETING
+    _drop_albums(update.effective_user.id)
 
     text = (
         "🎣 <b>Привет, рыбак!</b>\n"
@@ -305,247 +93,77 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Русская Рыбалка 4 — <b>Mazaii tv 🎣</b>"
     )
 
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📮 Предложить пост", callback_data="start_post")],
-    ])
-
     await update.message.reply_text(
         text,
         parse_mode="HTML",
-        reply_markup=kb
+        reply_markup=make_greeting_kb()
     )
 
     return GREETING
 
 
-# --- ШАГ 1: выбор водоёма ---
-from locations import ALL_LOCATIONS  # убедись, что импорт есть сверху
+async def start_post_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
 
-def make_location_kb(selected=None):
-    buttons = []
-    row = []
+    context.user_data.clear()
+    context.user_data["photos"] = []
 
-    for code, name in ALL_LOCATIONS.items():
-        label = f"✅ {name}" if code == selected else name
-        row.append(InlineKeyboardButton(label, callback_data=f"loc_{code}"))
-        # Когда собрали 2 кнопки — переносим в новую строку
-        if len(row) == 2:
-            buttons.append(row)
-            row = []
-    if row:
-        buttons.append(row)
+    # новое сообщение, приветствие остаётся в чате
+    return await wizard.show(update, context, "LOCATION", new=True)
 
-    # Добавляем навигационные кнопки
-    buttons.append([
-        InlineKeyboardButton("⬅️ Назад", callback_data="nav_back"),
-        InlineKeyboardButton("✅ Подтвердить", callback_data="nav_next")
-    ])
 
-    return InlineKeyboardMarkup(buttons)
+async def _save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await save_draft_async(update.effective_user.id, json.dumps(context.user_data))
 
 
-# --------------------- Шаги 1–6 ---------------------
+# --- ШАГ 1: выбор водоёма ---
 async def location_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
 
-    # Извлекаем выбранный водоём
-    loc = q.data.split("_", 1)[1]
+    _, (loc,) = decode(q.data)
     context.user_data["location"] = loc
+    await _save(update, context)
 
     # Обновляем клавиатуру, показывая выбранный вариант с галочкой
-    await q.edit_message_reply_markup(reply_markup=make_location_kb(selected=loc))
-    return LOCATION
-
-async def location_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-
-    if "location" not in context.user_data:
-        await q.answer("Выберите водоём перед продолжением ⛔", show_alert=True)
-        return LOCATION
-
-    await q.edit_message_text(
-        "🎣 Шаг 2: Выберите тип точки:",
-        reply_markup=make_point_type_kb()
-    )
-    return POINT_TYPE
-
-
-async def location_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    await q.edit_message_text(
-        "🎣 Приветствую, рыболов!\n"
-        "Нажмите «📮 Предложить пост», чтобы начать заново.",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("📮 Предложить пост", callback_data="start_post")]
-        ])
-    )
-    return GREETING
-
-# --- ШАГ 2: выбор типа точки ---
-def make_point_type_kb(selected=None):
-    """
-    Клавиатура выбора типа точки (2 столбца, можно выбрать до двух вариантов)
-    """
-    point_types = [
-        ("farm", "Фарм"),
-        ("trophy", "Трофей"),
-        ("vysek", "Высед"),
-        ("quest", "Задание"),
-    ]
-
-    # приводим selected к множеству для удобства
-    selected = set(selected or [])
-    buttons = []
-    row = []
-
-    for code, label in point_types:
-        text = f"✅ {label}" if code in selected else label
-        row.append(InlineKeyboardButton(text, callback_data=f"pt_{code}"))
-        if len(row) == 2:  # два в строке
-            buttons.append(row)
-            row = []
-    if row:
-        buttons.append(row)
-
-    # навигация внизу
-    buttons.append([
-        InlineKeyboardButton("⬅️ Назад", callback_data="nav_back"),
-        InlineKeyboardButton("✅ Подтвердить", callback_data="nav_next"),
-    ])
-    return InlineKeyboardMarkup(buttons)
+    return await wizard.refresh(update, context, "LOCATION", soon=True)
 
 
+# --- ШАГ 2: выбор типа точки (до двух) ---
 async def point_type_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
-    await q.answer()
-    raw = q.data  # полностью callback_data, например "pt_farm" или "nav_next"
-
-    # Навигация: Назад
-    if raw == "nav_back":
-        await q.edit_message_text(
-            "📍 Шаг 1: Выберите водоём:",
-            reply_markup=make_location_kb(selected=context.user_data.get("location"))
-        )
-        return LOCATION
-
-    # Навигация: Далее
-    if raw == "nav_next":
-        # Проверяем, выбрано ли хотя бы одно значение (если нужно)
-        chosen = context.user_data.get("point_types", [])
-        if not chosen:
-            # предупреждение пользователю (alert)
-            await q.answer("Выберите хотя бы один тип точки перед продолжением.", show_alert=True)
-            return POINT_TYPE
-
-        await q.edit_message_text(
-            "🎣 Шаг 3: Выберите вид рыбы:",
-            reply_markup=make_fish_type_kb()
-        )
-        return FISH_TYPE
-
-    # Если пришёл выбор типа (pt_...)
-    if raw.startswith("pt_"):
-        key = raw.split("_", 1)[1]
-        chosen = set(context.user_data.get("point_types", []))
+    _, (key,) = decode(q.data)
+    chosen = set(context.user_data.get("point_types", []))
 
-        # переключаем (до 2 значений одновременно)
-        if key in chosen:
-            chosen.remove(key)
-        else:
-            if len(chosen) < 2:
-                chosen.add(key)
-            else:
-                # если уже 2 — показываем предупреждение
-                await q.answer("Можно выбрать не более 2 типов.", show_alert=True)
-                return POINT_TYPE
-
-        context.user_data["point_types"] = list(chosen)
-        await q.edit_message_reply_markup(reply_markup=make_point_type_kb(selected=chosen))
+    if key in chosen:
+        chosen.remove(key)
+    elif len(chosen) < POINT_TYPES_MAX:
+        chosen.add(key)
+    else:
+        await q.answer(f"Можно выбрать не более {POINT_TYPES_MAX} типов.", show_alert=True)
         return POINT_TYPE
 
-    # Незнакомый callback — оставляем состояние
     await q.answer()
-    return POINT_TYPE
+    context.user_data["point_types"] = list(chosen)
+    await _save(update, context)
+    return await wizard.refresh(update, context, "POINT_TYPE", soon=True)
 
-# --- ШАГ 3: выбор вида рыбы ---
-def make_fish_type_kb(selected=None):
-    buttons = []
-    fishes = ["Разнорыбица", "Написать самому"]
-    row = []
-    for fish in fishes:
-        label = f"✅ {fish}" if fish == selected else fish
-        row.append(InlineKeyboardButton(label, callback_data=f"fish_{fish}"))
-        if len(row) == 2:
-            buttons.append(row)
-            row = []
-    if row:
-        buttons.append(row)
-
-    # Навигация
-    buttons.append([
-        InlineKeyboardButton("⬅️ Назад", callback_data="fish_back"),
-        InlineKeyboardButton("✅ Подтвердить", callback_data="fish_next")
-    ])
-    return InlineKeyboardMarkup(buttons)
 
+# --- ШАГ 3: выбор вида рыбы ---
 async def fish_type_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    data = q.data.replace("fish_", "")
-
-    # Назад
-    if data == "back":
-        await q.edit_message_text(
-            "📍 Шаг 2: Выберите тип точки:",
-            reply_markup=make_point_type_kb(selected=context.user_data.get("point_type"))
-        )
-        return POINT_TYPE
-
-    # Далее
-    if data == "next":
-        if "fish_type" not in context.user_data:
-            await q.answer("Выберите рыбу или введите её вручную ⛔", show_alert=True)
-            return FISH_TYPE
-        await q.edit_message_text(
-            "🎣 Шаг 4: Выберите тип ловли:",
-            reply_markup=make_fishing_type_kb()
-        )
-        return FISHING_TYPE
+    _, (fish,) = decode(q.data)
 
     # Если выбрано «Написать самому» → ждём текст
-    if data == "Написать самому":
-        await q.edit_message_text("Введите название рыбы:")
+    if fish == FISH_CUSTOM:
+        await edit_text(q, "Введите название рыбы:")
         return FISH_TYPE_TEXT
 
-    # Иначе — обычный выбор (ставим галочку)
-    context.user_data["fish_type"] = data
-    await q.edit_message_reply_markup(reply_markup=make_fish_type_kb(selected=data))
-    return FISH_TYPE
-
-
-# --- Шаг 4.1: ввод параметра после выбора типа ловли ---
-async def extra_param_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Принимаем значение после выбора типа ловли (клипса, глубина, скорость и т.д.)"""
-    value = update.message.text.strip()
-    if not value:
-        await update.message.reply_text("Введите корректное значение ⛔")
-        return DETAIL
-
-    context.user_data["fishing_extra"] = value
-
-    await update.message.reply_text(
-        f"✅ Значение принято: {value}\n\nТеперь нажмите «➡️ Далее», чтобы продолжить.",
-        reply_markup=InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("⬅️ Назад", callback_data="go_back:FISHING_TYPE"),
-                InlineKeyboardButton("✅ Подтвердить", callback_data="go_next:COORDS")
-            ]
-        ])
-    )
-    return DETAIL
+    context.user_data["fish_type"] = fish
+    await _save(update, context)
+    return await wizard.refresh(update, context, "FISH_TYPE")
 
 
 async def fish_type_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -556,137 +174,36 @@ async def fish_type_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return FISH_TYPE_TEXT
 
     context.user_data["fish_type"] = fish_name
-    await update.message.reply_text(
-        f"✅ Рыба: {fish_name}\n\nТеперь нажмите «✅ Подтвердить» чтобы продолжить.",
-        reply_markup=make_fish_type_kb(selected="Написать самому")
-    )
-    return FISH_TYPE
+    await _save(update, context)
+    return await wizard.show(update, context, "FISH_TYPE", note=f"✅ Рыба: {escape(fish_name)}")
 
 
 # --- ШАГ 4: выбор типа ловли ---
-def make_fishing_type_kb(selected=None):
-    options = [
-        ("Донка", "donka"),
-        ("Поплавок", "poplavok"),
-        ("Спиннинг", "spin"),
-        ("Троллинг", "trol"),
-        ("Пилкинг", "pilk")
-    ]
-    buttons = []
-    for i in range(0, len(options), 2):
-        row = []
-        for label, key in options[i:i+2]:
-            mark = "✅ " if selected == key else ""
-            row.append(InlineKeyboardButton(f"{mark}{label}", callback_data=f"ft_{key}"))
-        buttons.append(row)
-    buttons.append([
-        InlineKeyboardButton("⬅️ Назад", callback_data="nav_back"),
-        InlineKeyboardButton("✅ Подтвердить", callback_data="nav_next")
-    ])
-    return InlineKeyboardMarkup(buttons)
-
-
 async def fishing_type_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Шаг 4: выбор типа ловли.
-    Бот отмечает выбор галочкой и ждёт подтверждения.
-    После нажатия «✅ Подтвердить» переходит к шагу ввода параметра.
-    """
     q = update.callback_query
     await q.answer()
-    data = q.data
-
-    # Назад
-    if data == "nav_back":
-        await q.edit_message_text(
-            "🎯 Шаг 3: Выберите вид рыбы:",
-            reply_markup=make_fish_type_kb(selected=context.user_data.get("fish_type"))
-        )
-        return FISH_TYPE
-
-    # Подтвердить
-    if data in ("nav_next", "go_next:DETAIL"):
-        if "fishing_type" not in context.user_data:
-            await q.answer("Выберите тип ловли перед продолжением ⛔", show_alert=True)
-            return FISHING_TYPE
-
-        fishing_type = context.user_data["fishing_type"]
-
-        prompts = {
-            "poplavok": "🎣 Укажите глубину (например: 150 см.)",
-            "spin": "🎣 Укажите скорость проводки (например: 15)",
-            "donka": "🎣 Укажите клипсу (например: 15 м.)",
-            "trol": "🎣 Укажите клипсу (например: 30 м.)",
-            "pilk": "🎣 Укажите тип пилкинга (например: сильный)"
-        }
-        prompt_text = prompts.get(fishing_type, "🎣 Укажите параметр:")
-
-        await q.edit_message_text(prompt_text)
-        return DETAIL
-
-    # Выбор типа ловли
-    if data.startswith("ft_"):
-        key = data.split("_", 1)[1]
-        context.user_data["fishing_type"] = key
-        context.user_data["fishing"] = key
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
+    _, (key,) = decode(q.data)
 
-        await q.edit_message_reply_markup(reply_markup=make_fishing_type_kb(selected=key))
-        return FISHING_TYPE
-
-    return FISHING_TYPE
+    context.user_data["fishing_type"] = key
+    context.user_data["fishing"] = key
+    await _save(update, context)
+    return await wizard.refresh(update, context, "FISHING_TYPE")
 
 
+# --- Шаг 4.1: параметр ловли (клипса, глубина, скорость и т.д.) ---
 async def fishing_detail_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Принимаем значение после выбора типа ловли (клипса, глубина и т. д.)
-       Сохраняем под ключом 'fishing_extra' — чтобы оно попадало в предпросмотр и пост."""
+    """Сохраняем под ключом 'fishing_extra' — чтобы оно попадало в предпросмотр и пост."""
     text = update.message.text.strip()
     if not text:
         await update.message.reply_text("Введите корректное значение ⛔")
         return DETAIL
 
-    # сохраняем именно в fishing_extra (build_post_text читает fishing_extra)
     context.user_data["fishing_extra"] = text
-    save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-    # подтверждаем и показываем кнопку Подтвердить (как было прежде)
-    await update.message.reply_text(
-        f"✅ Сохранено: {text}\n\nТеперь нажмите '✅ Подтвердить', чтобы перейти к следующему шагу.",
-        reply_markup=InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("⬅️ Назад", callback_data="go_back:FISHING_TYPE"),
-                InlineKeyboardButton("✅ Подтвердить", callback_data="go_next:COORDS")
-            ]
-        ])
-    )
-    return DETAIL
+    await _save(update, context)
+    return await wizard.show(update, context, "DETAIL", note=f"✅ Сохранено: {escape(text)}")
 
 
 # ---------- ШАГ 5: Координаты ----------
-import re
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-
-def make_coordinates_kb():
-    """Кнопки подтверждения координат (появляются только после ввода)."""
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("⬅️ Назад", callback_data="go_back:FISHING_TYPE"),
-            InlineKeyboardButton("✅ Подтвердить", callback_data="go_next:TEMP")
-        ]
-    ])
-
-async def coords_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-
-    await q.edit_message_text(
-        "📍 <b>Шаг 5:</b> Введите координаты\n"
-        "Пример: <code>56:123</code>",
-        parse_mode="HTML"
-    )
-
-    return COORDS   # ✅ ТОЛЬКО COORDS
-
 async def coords_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
 
@@ -697,234 +214,34 @@ async def coords_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return COORDS   # 🔁 остаёмся тут
 
     context.user_data["coords"] = text
-    save_draft(update.effective_user.id, json.dumps(context.user_data))
+    await _save(update, context)
+    return await wizard.show(update, context, "COORDS", note=f"✅ Координаты сохранены: <b>{text}</b>")
 
-    await update.message.reply_text(
-        f"✅ Координаты сохранены: <b>{text}</b>\n\n"
-        "Нажмите «Продолжить»",
-        parse_mode="HTML",
-        reply_markup=make_coordinates_kb()
-    )
-
-    return COORDS   # ❗ ОСТАЁМСЯ В COORDS, ждём кнопку
-
-async def coords_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Навигация на шаге координат."""
-    q = update.callback_query
-    await q.answer()
-    data = q.data
-
-    # ⬅️ Назад к типу ловли
-    if data == "go_back:FISHING_TYPE":
-        await q.edit_message_text(
-            "🎣 Шаг 4: Выберите тип ловли:",
-            reply_markup=make_fishing_type_kb(
-                selected=context.user_data.get("fishing_type")
-            )
-        )
-        return FISHING_TYPE
-
-    # ➡️ Далее — к температуре
-    if data == "go_next:TEMP":
-        if "coords" not in context.user_data:
-            await q.answer("❗ Сначала введите координаты", show_alert=True)
-            return COORDS   # ⛔ остаёмся тут
-
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-        await q.edit_message_text(
-            "🌡 <b>Шаг 6:</b> Укажите температуру воды:",
-            parse_mode="HTML",
-            reply_markup=attach_nav(
-                make_temp_kb(),
-                "COORDS",
-                "COMMENT"
-            )
-        )
-        return TEMP
-
-    # 🔁 Если что-то пошло не так — не ломаем сценарий
-    return COORDS
 
 # ---------- ШАГ 6: Температура ----------
-def make_temp_kb(selected=None):
-    """Клавиатура для выбора температуры воды — только варианты,
-       навигация добавляется вручную (⬅️ Назад / ➡️ Продолжить)."""
-    buttons = [
-        [
-            InlineKeyboardButton(
-                ("✅ Повышенная" if selected == "high" else "Повышенная"),
-                callback_data="temp_high"
-            ),
-            InlineKeyboardButton(
-                ("✅ Пониженная" if selected == "low" else "Пониженная"),
-                callback_data="temp_low"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                ("✅ Нормальная" if selected == "normal" else "Нормальная"),
-                callback_data="temp_normal"
-            ),
-            InlineKeyboardButton(
-                ("✅ Пропустить" if selected == "skip" else "Пропустить"),
-                callback_data="temp_skip"
-            )
-        ]
-    ]
-    return InlineKeyboardMarkup(buttons)
-
-
 async def temp_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка выбора температуры и навигации на шаге 6."""
     q = update.callback_query
     await q.answer()
-    cb = q.data  # например: temp_high / go_back:COORDS / go_next:COMMENT
-
-    # --- Назад (из навигации) ---
-    if cb.startswith("go_back:"):
-        target = cb.split(":", 1)[1]
-        if target == "COORDS":
-            # Возврат к шагу 5 — показываем экран ввода координат (с прежней клавиатурой)
-            await q.edit_message_text(
-                "📍 Шаг 5: Укажите координаты:",
-                reply_markup=attach_nav(make_coordinates_kb(), "FISHING_TYPE", "TEMP")
-            )
-            return COORDS
-
-    # --- Нажали "Продолжить" (переход дальше) ---
-    if cb.startswith("go_next:"):
-        target = cb.split(":", 1)[1]
-        if "temp" not in context.user_data:
-            await q.answer("Выберите температуру или нажмите «Пропустить» ⛔", show_alert=True)
-            return TEMP
-
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-        await q.edit_message_text(
-            "📝 Шаг 7: Добавьте комментарий (необязательно):",
-            reply_markup=make_comment_kb(has_comment=False)
-        )
-        return COMMENT
-
-    # --- Нажали одну из кнопок temp_* ---
-    if cb.startswith("temp_"):
-        opt = cb.replace("temp_", "")  # high / low / normal / skip
-
-        # Если выбрали "Пропустить" — сразу к комментарию
-        if opt == "skip":
-            context.user_data["temp"] = None
-            save_draft(update.effective_user.id, json.dumps(context.user_data))
-            await q.edit_message_text(
-                "📝 Шаг 7: Добавьте комментарий (необязательно):",
-                reply_markup=make_comment_kb(has_comment=False)
-            )
-            return COMMENT
-
-        # Сохраняем выбор
-        context.user_data["temp"] = opt
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-        # --- Составляем клавиатуру с отмеченной опцией и кнопкой "Продолжить" ---
-        # Отмечаем выбранную опцию галочкой
-        def label(name_key, label_text):
-            return f"✅ {label_text}" if name_key == opt else label_text
-
-        buttons = [
-            [
-                InlineKeyboardButton(label("high", "Повышенная"), callback_data="temp_high"),
-                InlineKeyboardButton(label("low", "Пониженная"), callback_data="temp_low")
-            ],
-            [
-                InlineKeyboardButton(label("normal", "Нормальная"), callback_data="temp_normal"),
-                InlineKeyboardButton(label("skip", "Пропустить"), callback_data="temp_skip")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Назад", callback_data="go_back:COORDS"),
-                InlineKeyboardButton("✅ Продолжить", callback_data="go_next:COMMENT")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(buttons)
-
-        # Текст выбранной температуры для вывода
-        temp_text = "Нормальная" if opt == "normal" else ("Повышенная" if opt == "high" else "Пониженная")
-
-        # Редактируем сообщение (показываем отмеченный выбор)
-        try:
-            await q.edit_message_text(
-                f"🌡 Шаг 6: Укажите температуру воды:\n\nВы выбрали: *{temp_text}*",
-                parse_mode="Markdown",
-                reply_markup=reply_markup
-            )
-        except Exception:
-            # Если не удалось отредактировать текст (иногда бывает), просто обновим клавиатуру
-            try:
-                await q.edit_message_reply_markup(reply_markup=reply_markup)
-            except Exception:
-                pass
-
-        return TEMP
+    _, (opt,) = decode(q.data)  # high / low / normal / skip
 
-    # Если пришёл неожиданный callback — ничего не делаем
-    await q.answer("Неизвестное действие ⛔")
-    return TEMP
+    # «Пропустить» — без температуры и сразу дальше
+    if opt == "skip":
+        context.user_data["temp"] = None
+        await _save(update, context)
+        return await wizard.show(update, context, wizard["TEMP"].next)
 
+    context.user_data["temp"] = opt
+    await _save(update, context)
+    # текст экрана тоже меняется («Вы выбрали: …»)
+    return await wizard.show(update, context, "TEMP", soon=True)
 
 
 # ---------- ШАГ 7: Комментарий ----------
-
-def make_comment_kb(has_comment=False):
-    """Кнопки для шага 7: добавить комментарий или пропустить"""
-    if not has_comment:
-        buttons = [
-            [InlineKeyboardButton("✏️ Написать комментарий", callback_data="comment_write")],
-            [
-                InlineKeyboardButton("⬅️ Назад", callback_data="go_back:TEMP"),
-                InlineKeyboardButton("➡️ Пропустить", callback_data="comment_skip")
-            ]
-        ]
-    else:
-        buttons = [
-            [
-                InlineKeyboardButton("⬅️ Назад", callback_data="go_back:TEMP"),
-                InlineKeyboardButton("✅ Подтвердить", callback_data="go_next:AUTHOR")
-            ]
-        ]
-    return InlineKeyboardMarkup(buttons)
-
-
-async def comment_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка кнопок на шаге комментария"""
+async def comment_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    data = q.data
-
-    # 🔙 Назад
-    if data == "go_back:TEMP":
-        await q.edit_message_text(
-            "🌡 Шаг 6: Укажите температуру воды:",
-            reply_markup=make_temp_kb(selected=context.user_data.get("temp"))
-        )
-        return TEMP
-
-    # ⏭️ Пропустить
-    if data == "comment_skip":
-        context.user_data["comment"] = None
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-        return await author_start(update, context)
-
-    # ✏️ Написать комментарий
-    if data == "comment_write":
-        await q.edit_message_text("Введите ваш комментарий:")
-        return COMMENT_TEXT
-
-    # ➡️ Далее
-    if data == "go_next:AUTHOR":
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-        return await author_start(update, context)
-
-    # если вдруг пришло что-то другое
-    await q.answer("Неизвестное действие ⛔")
-    return COMMENT
+    await edit_text(q, "Введите ваш комментарий:")
+    return COMMENT_TEXT
 
 
 async def comment_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -935,277 +252,150 @@ async def comment_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Комментарий не может быть пустым ⛔")
         return COMMENT_TEXT
 
-    # сохраняем
     context.user_data["comment"] = text
-    save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-    # показываем, что комментарий сохранён
-    await update.message.reply_text(
-        f"✅ Комментарий сохранён.\n\n"
-        f"Нажмите «✅ Подтвердить», чтобы перейти к следующему шагу.",
-        reply_markup=make_comment_kb(has_comment=True)
-    )
-
-    # остаёмся на шаге комментария
-    return COMMENT
-
-
-# ---------- ШАГ 8: Ввод ника ----------
-
-def make_author_kb():
-    """Кнопки для шага с вводом ника"""
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("⬅️ Назад", callback_data="go_back:COMMENT"),
-            InlineKeyboardButton("✅ Подтвердить", callback_data="go_next:PHOTOS")
-        ]
-    ])
-
-
-async def author_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Переход на шаг 8 — ввод ника"""
-    q = update.callback_query
-    await q.answer()
-    await q.edit_message_text(
-        "👤 Шаг 8: Укажите свой игровой ник:",
-        reply_markup=make_author_kb()
-    )
-    return AUTHOR
+    await _save(update, context)
+    return await wizard.show(update, context, "COMMENT", note="✅ Комментарий сохранён.")
 
 
 # ---------- ШАГ 8: Автор ----------
 async def author_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Пользователь вводит ник → подтверждает и только потом идёт на фото"""
     text = update.message.text.strip()
     if not text:
         await update.message.reply_text("Введите корректный ник ⛔")
         return AUTHOR
 
-    # Сохраняем ник
     context.user_data["author"] = text
-    save_draft(update.effective_user.id, json.dumps(context.user_data))
-
-    # Показываем подтверждение
-    await update.message.reply_text(
-        f"✅ Ник сохранён: {text}\n\nТеперь нажмите «✅ Подтвердить», чтобы перейти к следующему шагу (фото).",
-        reply_markup=InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("⬅️ Назад", callback_data="go_back:COMMENT"),
-                InlineKeyboardButton("✅ Подтвердить", callback_data="go_next:PHOTOS")
-            ]
-        ])
-    )
-    return AUTHOR
+    await _save(update, context)
+    return await wizard.show(update, context, "AUTHOR", note=f"✅ Ник сохранён: {escape(text)}")
 
 
 # ---------- ШАГ 9: Фото ----------
+# Альбом приходит отдельным апдейтом на каждое фото с общим media_group_id.
+# Такие фото копятся ALBUM_WINDOW секунд и добавляются одной пачкой:
+# один save_draft и один ответ на весь альбом вместо десяти.
+# Пачка живёт, только пока пользователь на шаге PHOTOS: «Далее»/«Назад»
+# забирают её в черновик сразу, /start, /cancel и истечение черновика —
+# выбрасывают. Job, сработавший после этого, пачки уже не найдёт.
+PHOTOS_MAX = 10
+ALBUM_WINDOW = 1.0
+
+_albums: dict[tuple[int, str], list[tuple[str, str]]] = {}
+
+
+def _photo_ids(message) -> tuple[str, str] | None:
+    """(file_id, file_unique_id) скриншота; file_unique_id постоянный — для архива и поиска дублей."""
+    if message.photo:
+        return message.photo[-1].file_id, message.photo[-1].file_unique_id
+    if message.document and (message.document.mime_type or "").startswith("image/"):
+        return message.document.file_id, message.document.file_unique_id
+    return None
+
+
+def _add_photos(data: dict, items) -> tuple[int, int, int]:
+    """Добавляет фото в черновик. Возвращает (добавлено, повторов, сверх лимита)."""
+    photos = data.setdefault("photos", [])
+    uids = data.setdefault("photo_uids", [])
+    seen = set(uids)
+    added = dup = over = 0
+    for file_id, unique_id in items:
+        if unique_id in seen:
+            dup += 1
+        elif len(photos) >= PHOTOS_MAX:
+            over += 1
+        else:
+            photos.append(file_id)
+            uids.append(unique_id)
+            seen.add(unique_id)
+            added += 1
+    return added, dup, over
 
-def make_photos_kb():
-    """Кнопки для шага загрузки фото"""
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("⬅️ Назад", callback_data="go_back:AUTHOR"),
-            InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_screenshots")
-        ]
-    ])
-
-
-async def photos_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает инструкцию по загрузке фото"""
-    text = (
-        "📸 <b>Шаг 9: Загрузите до 10 скриншотов.</b>\n\n"
-        "<b>Скриншоты должны включать:</b>\n"
-        "• 🎯 Место ловли\n"
-        "• 🎒 Садок\n"
-        "• 🧂 Прикорм\n"
-        "• 🗺 Карту точки\n"
-        "• 🎣 Сборку с наживкой\n\n"
-        "📤 Отправляйте скриншоты <b>обычными сообщениями</b>.\n"
-        "⚠️ Обязательно поставьте галочки:\n"
-        "• «Сжимать фото»\n"
-        "• «Группировать»\n\n"
-        "🚫 <b>Фотографии монитора не принимаются.</b>\n\n"
-        "Когда загрузите все изображения — нажмите «Подтвердить»."
-    )
-
-    await update.callback_query.edit_message_text(
-        text=text,
-        parse_mode="HTML",
-        reply_markup=make_photos_kb()
-    )
-    return PHOTOS
 
-async def photo_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Приём до 10 скриншотов"""
-    user_id = update.effective_user.id
-    photos = context.user_data.get("photos", [])
-
-    # Получаем file_id
-    if update.message.photo:
-        file_id = update.message.photo[-1].file_id
-    elif update.message.document and update.message.document.mime_type.startswith("image/"):
-        file_id = update.message.document.file_id
+async def _commit_photos(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, items) -> int:
+    data = context.user_data
+    added, dup, over = _add_photos(data, items)
+    if added:
+        await save_draft_async(user_id, json.dumps(data))
+
+    count = len(data["photos"])
+    if added == 1:
+        lines = [f"✅ Скриншот добавлен ({count}/{PHOTOS_MAX})."]
+    elif added:
+        lines = [f"✅ Добавлено скриншотов: {added} ({count}/{PHOTOS_MAX})."]
     else:
-        await update.message.reply_text("⛔ Отправьте именно скриншот (фото).")
-        return PHOTOS
-
-    # Проверка лимита
-    if len(photos) >= 10:
-        await update.message.reply_text(
-            "📸 Вы уже загрузили 10 скриншотов — это максимум.",
-            reply_markup=make_photos_kb()
-        )
-        return PHOTOS
+        lines = []
+    if dup:
+        lines.append(f"♻️ Повторы пропущены: {dup}.")
+    if over:
+        lines.append(f"📸 Больше {PHOTOS_MAX} скриншотов нельзя — не добавлено: {over}.")
+    lines.append("Когда закончите, нажмите «Подтвердить».")
 
-    # Добавляем
-    photos.append(file_id)
-    context.user_data["photos"] = photos
-    save_draft(user_id, json.dumps(context.user_data))
-
-    await update.message.reply_text(
-        f"✅ Скриншот добавлен ({len(photos)}/10).\n"
-        "Когда закончите, нажмите «Подтвердить».",
-        reply_markup=make_photos_kb()
+    await context.bot.send_message(
+        chat_id,
+        "\n".join(lines),
+        reply_markup=wizard["PHOTOS"].keyboard(data),
     )
     return PHOTOS
 
 
-async def photos_done_btn(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """После загрузки фото → Предпросмотр"""
-    q = update.callback_query
-    await q.answer()
-    data = q.data
-
-    if data == "go_back:AUTHOR":
-        await q.edit_message_text(
-            "👤 Шаг 8: Укажите свой игровой ник:",
-            reply_markup=make_author_kb()
-        )
-        return AUTHOR
-
-    if data == "confirm_screenshots":
-        save_draft(update.effective_user.id, json.dumps(context.user_data))
-        text = build_post_text(context.user_data)
-        kb = make_confirm_kb()
-        kb = attach_nav(kb, "PHOTOS", None)
-        await q.edit_message_text("Шаг 10: Предпросмотр:\n\n" + text, reply_markup=kb)
-        return PREVIEW
-
-    return PHOTOS
+def _drop_albums(user_id: int) -> list[tuple[str, str]]:
+    """Забирает все ещё не добавленные альбомы пользователя."""
+    items = []
+    for key in [key for key in _albums if key[0] == user_id]:
+        items += _albums.pop(key)
+    return items
 
 
-# --------------------- Сборка текста ---------------------
-from locations import ALL_LOCATIONS  # импортируем словарь
-
-def build_post_text(data: dict) -> str:
-    # Справочники
-    point_type_map = {
-        "farm": "Фарм",
-        "trophy": "Трофей",
-        "vysek": "Высед",
-        "quest": "Задание",
-    }
-
-    fish_map = {
-        "mix":   "Разнорыбица",
-        "carp":  "Карп",
-        "pike":  "Щука",
-        "perch": "Окунь",
-        "bream": "Лещ",
-    }
-
-    fishing_map = {
-        "donka":    "Донка кл.",
-        "poplavok": "Поплавок гл.",
-        "spin":     "Спиннинг ск.",
-        "trol":     "Троллинг кл.",
-        "pilk":     "Пилкинг",
-    }
-
-    temp_map = {
-        "normal": "Нормальная",
-        "high": "Повышенная",
-        "low":  "Пониженная",
-    }
-
-    # Извлекаем данные
-    location_code = data.get("location", "")
-    types = data.get("point_types", [])
-    fish_code = data.get("fish_type", "")
-    fishing_code = data.get("fishing_type", "")
-    extra = data.get("fishing_extra", "")
-    coords = data.get("coords", "")
-    temp_code = data.get("temp", "")
-    author = data.get("author", "")
-    comment = data.get("comment", "")
-
-    # Преобразуем значения в текст
-    lake = ALL_LOCATIONS.get(location_code, location_code)
-    types_text = ", ".join(point_type_map.get(t, t) for t in types) if types else "—"
-    fish = fish_map.get(fish_code, fish_code)
-    fishing = fishing_map.get(fishing_code, fishing_code)
-    temp = temp_map.get(temp_code, temp_code)
-
-    hashtag = "#" + (
-        lake.lower()
-        .replace(" ", "_")
-        .replace(".", "")
-        .replace("ё", "е")
-    )
+async def _take_albums(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Уход с шага PHOTOS: альбом, пришедший меньше ALBUM_WINDOW назад, — в черновик сейчас."""
+    items = _drop_albums(update.effective_user.id)
+    if items and _add_photos(context.user_data, items)[0]:
+        await _save(update, context)
 
-    # Формируем строки
-    lines = [
-        f"📍 Водоём:  {hashtag}",
-        f"🎯 Точка: {types_text}",
-        f"🐟 Рыба: {fish}",
-        f"🎣 Ловля: {fishing}" + (f" {extra}" if extra else ""),
-        f"🗺 Координаты: {coords}",
-    ]
 
-    # 🌡 Добавляем температуру, только если выбрана
-    if temp_code and str(temp_code).lower() not in ("none", "null", "nan", ""):
-        lines.append(f"🌡 Температура: {temp}")
+async def _album_done(context: ContextTypes.DEFAULT_TYPE):
+    job = context.job
+    items = _albums.pop(job.data, [])
+    if items:
+        await _commit_photos(context, job.chat_id, job.user_id, items)
 
-    if comment:
-        lines.append(f"📝 Комментарий: {comment}")
 
-    if author:
-        lines.append(f"👤 Автор: {author}")
-    else:
-        lines.append("👤 Автор: неизвестен")
+async def photo_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Приём до 10 скриншотов (по одному или альбомом)"""
+    ids = _photo_ids(update.message)
+    if ids is None:
+        await update.message.reply_text("⛔ Отправьте именно скриншот (фото).")
+        return PHOTOS
 
-    return "\n".join(lines)
+    user_id = update.effective_user.id
+    group = update.message.media_group_id
+    if not group:
+        return await _commit_photos(context, update.effective_chat.id, user_id, [ids])
+
+    key = (user_id, group)
+    batch = _albums.get(key)
+    if batch is None:
+        batch = _albums[key] = []
+        context.job_queue.run_once(
+            _album_done, ALBUM_WINDOW, data=key,
+            chat_id=update.effective_chat.id, user_id=user_id,
+        )
+    batch.append(ids)
+    return PHOTOS
 
 
 # --------------------- Модерация ---------------------
 import os, json, asyncio, logging
 
-from telegram.error import TelegramError, TimedOut
+from telegram.error import TelegramError
 from telegram.ext import ConversationHandler
 
 logger = logging.getLogger(__name__)
 
-async def confirm_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отправить пост в модераторский чат для подтверждения"""
-    q = update.callback_query
-    await q.answer()
-
-    data = context.user_data
+async def _send_to_moderators(bot, mod_chat: int, post_id: int, data: dict):
+    """Пост и под ним сообщение с кнопками — строго в этом порядке."""
     base_text = build_post_text(data)
     author = data.get("author", "user")
     photos = data.get("photos", [])
-    user_id = update.effective_user.id
-
-    mod_chat = _mod_chat_id()
-    if not mod_chat:
-        await q.edit_message_text("❗ Ошибка: MOD_CHAT_ID не задан.")
-        return ConversationHandler.END
-
-    # Убираем кнопки у пользователя
-    try:
-        await q.edit_message_text("✅ Ваш пост отправлен на модерацию.")
-    except Exception:
-        pass
 
     # --- 1. Отправляем сам пост (без клавиатуры) ---
     if photos:
@@ -1213,28 +403,65 @@ async def confirm_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
             media = [InputMediaPhoto(media=photos[0], caption=base_text, parse_mode="HTML")]
             for pid in photos[1:]:
                 media.append(InputMediaPhoto(media=pid))
-            await context.bot.send_media_group(chat_id=mod_chat, media=media)
+            sent = await bot.send_media_group(chat_id=mod_chat, media=media)
         else:
-            await context.bot.send_photo(
+            sent = [await bot.send_photo(
                 chat_id=mod_chat,
                 photo=photos[0],
                 caption=base_text,
                 parse_mode="HTML"
-            )
+            )]
     else:
-        await context.bot.send_message(chat_id=mod_chat, text=base_text, parse_mode="HTML")
+        sent = [await bot.send_message(chat_id=mod_chat, text=base_text, parse_mode="HTML")]
 
     # --- 2. Отдельное сообщение с кнопками ---
-    msg = await context.bot.send_message(
+    msg = await bot.send_message(
         chat_id=mod_chat,
-        text=f"👤 Автор: {author}\n\nОдобрить пост?",
-        reply_markup=make_moderation_kb(user_id),
+        text=f"👤 Автор: {escape(str(author))}\n\nОдобрить пост?",
+        reply_markup=make_moderation_kb(post_id),
         parse_mode="HTML",
     )
 
-    # сохраняем chat_id и message_id, чтобы удалить позже
-    context.bot_data[f"moderation_msg_{user_id}"] = (msg.chat.id, msg.message_id)
-    logger.info("Save moderation msg: chat=%s id=%s", msg.chat.id, msg.message_id)
+    # сохраняем сообщения поста и кнопок: пост потом копируется в канал,
+    # сообщение с кнопками обновляется после решения
+    await run_write(
+        set_moderation_message, post_id, msg.chat.id, msg.message_id, [m.message_id for m in sent],
+    )
+    logger.info("Post %s: moderation msg chat=%s id=%s", post_id, msg.chat.id, msg.message_id)
+
+
+async def confirm_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отправить пост в модераторский чат для подтверждения"""
+    q = update.callback_query
+    data = context.user_data
+
+    # черновик мог потеряться (истёк, сброшен) — пустой пост модераторам не шлём
+    invalid = wizard.first_invalid(data)
+    if invalid:
+        step, error = invalid
+        await q.answer(error, show_alert=True)
+        return await wizard.show(update, context, step.name)
+    await q.answer()
+
+    user_id = update.effective_user.id
+
+    mod_chat = _mod_chat_id()
+    if not mod_chat:
+        await edit_text(q, "❗ Ошибка: MOD_CHAT_ID не задан.")
+        return ConversationHandler.END
+
+    # черновик уходит в очередь модерации (и перестаёт быть черновиком)
+    post_id = await submit_post_async(user_id, json.dumps(data))
+    post = dict(data)
+    # копия поста теперь в moderation_queue; в user_data ей больше не место
+    data.clear()
+
+    # ответ пользователю и отправка модераторам друг друга не ждут;
+    # если модераторская не ответила, пост всё равно виден в /queue
+    await fan_out({
+        "ответ пользователю": edit_text(q, "✅ Ваш пост отправлен на модерацию."),
+        "отправка модераторам": _send_to_moderators(context.bot, mod_chat, post_id, post),
+    }, label=f"пост {post_id}")
 
     return ConversationHandler.END
 
@@ -1245,7 +472,7 @@ async def confirm_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Сообщение пользователю
     try:
-        await q.edit_message_text("❌ Отправка поста отменена.")
+        await edit_text(q, "❌ Отправка поста отменена.")
     except Exception:
         # если не удалось отредактировать, отправляем новое
         await context.bot.send_message(chat_id=update.effective_user.id,
@@ -1255,137 +482,250 @@ async def confirm_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # ---------------------- Модерация: одобрить пост ----------------------
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
-from telegram.error import TelegramError, TimedOut
-import asyncio, json, os, logging
-
-logger = logging.getLogger(__name__)
-
-async def mod_approve(update, context):
+async def mod_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Одобряет пост и публикует в канал.
-    Кнопка «📨 ПРЕДЛОЖИТЬ ПОСТ» встроена в текст как кликабельная ссылка.
-    Работает при любом типе поста (текст, одно фото, медиагруппа).
+    Одобряет пост: статус approved и задача в очереди публикации — сразу,
+    сама отправка в канал идёт в фоне (publisher.py) с повторами.
     """
     q = update.callback_query
     await q.answer()
 
-    # --- убираем клавиатуру у модератора ---
-    try:
-        await q.edit_message_reply_markup(reply_markup=None)
-    except Exception as e:
-        logger.warning("Не удалось убрать клавиатуру: %s", e)
-
-    # --- получаем данные черновика ---
-    parts = q.data.split(":")
-    if len(parts) < 2:
+    _, args = decode(q.data)
+    if len(args) != 1 or not args[0].isdigit():
         await q.edit_message_text("Некорректный callback.")
         return
 
-    user_id = int(parts[1])
-    draft = load_draft(user_id)
-    if not draft:
-        await q.edit_message_text("Черновик не найден.")
+    post_id = int(args[0])
+    if not await run_write(approve_post, post_id):
+        await q.edit_message_text("Пост не найден или уже обработан.")
         return
 
-    data = json.loads(draft)
-    text = build_post_text(data)
+    # кнопки убираются вместе с текстом; итог воркер допишет сюда же
+    await q.edit_message_text("⏳ Пост одобрен, публикуется…")
+    kick(context.job_queue)
 
-    # добавляем кнопку в текст (кликабельная ссылка)
-    text += "\n\n📨 <b><a href='https://t.me/MazaiiBot?start=post'>ПРЕДЛОЖИТЬ ПОСТ</a></b>"
 
-    photos = data.get("photos", [])
-    if isinstance(photos, str):
-        photos = [photos]
-    elif not isinstance(photos, list):
-        photos = list(photos)
-
-    channel = os.getenv("CHANNEL_ID") or os.getenv("MAIN_CHANNEL_ID")
+async def mod_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отклонить пост"""
+    q = update.callback_query
+    await q.answer()
 
-    try:
-        if channel:
-            if photos:
-                if len(photos) > 1:
-                    # 📸 Несколько фото (медиагруппа)
-                    media = [InputMediaPhoto(media=photos[0], caption=text, parse_mode="HTML")]
-                    for pid in photos[1:]:
-                        media.append(InputMediaPhoto(media=pid))
-                    await context.bot.send_media_group(
-                        chat_id=channel,
-                        media=media,
-                        disable_notification=True,
-                        protect_content=True
-                    )
-                else:
-                    # 🖼 Одно фото
-                    await context.bot.send_photo(
-                        chat_id=channel,
-                        photo=photos[0],
-                        caption=text,
-                        parse_mode="HTML",
-                        disable_notification=True,
-                        protect_content=True
-                    )
-            else:
-                # 📝 Без фото
-                await context.bot.send_message(
-                    chat_id=channel,
-                    text=text,
-                    parse_mode="HTML",
-                    disable_notification=True,
-                    protect_content=True
-                )
-
-    except TimedOut:
-        logger.error("⏳ TimedOut при публикации поста.")
+    _, args = decode(q.data)
+    if len(args) != 1 or not args[0].isdigit():
+        await q.edit_message_text("Некорректный callback.")
         return
-    except TelegramError as e:
-        logger.error("Ошибка при публикации поста: %s", e)
+    post_id = int(args[0])
+    post = await run_read(load_post, post_id)
+    if not post or not await run_write(set_post_status, post_id, POST_REJECTED):
+        await q.edit_message_text("Пост не найден или уже обработан.")
         return
+    await fan_out({
+        "сообщение автору": context.bot.send_message(post["user_id"], "❌ Ваш пост отклонён модератором."),
+        "сообщение модерации": q.edit_message_text("🚫 Отклонено модератором."),
+    }, label=f"пост {post_id}")
 
-    # --- сообщение автору ---
-    await context.bot.send_message(
-        chat_id=user_id,
-        text="✅ Ваш пост опубликован."
-    )
 
-    # --- обновляем сообщение в модераторской ---
-    chat_id, msg_id = context.bot_data.get(f"moderation_msg_{user_id}", (None, None))
-    if chat_id and msg_id:
-        try:
-            await context.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=msg_id,
-                text="✅ Пост одобрен и опубликован.",
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.warning("Не удалось обновить текст модерации: %s", e)
-    else:
-        logger.warning("moderation_msg_%s не найден в bot_data", user_id)
+# --------------------- Модерация: очередь (/queue) ---------------------
+QUEUE_LIMIT = 30          # постов на одном экране очереди
+QUEUE_NOTIFY_PARALLEL = 8  # уведомлений об отклонении одновременно
 
-    delete_draft(user_id)
 
+def _queue_label(post_id: int, data: str) -> str:
+    data = json.loads(data)
+    location = ALL_LOCATIONS.get(data.get("location"), data.get("location") or "—")
+    author = data.get("author") or "—"
+    return f"#{post_id} {location} · {author}"[:48]
 
 
-async def mod_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отклонить пост"""
+async def _queue_screen(selected=frozenset()) -> tuple[str, object]:
+    total, rows = await run_read(list_pending_posts, QUEUE_LIMIT)
+    if not total:
+        return "📭 Очередь модерации пуста.", None
+    text = f"📋 На модерации: {total}"
+    if total > len(rows):
+        text += f" (показаны первые {len(rows)})"
+    items = [(post_id, _queue_label(post_id, data)) for post_id, data in rows]
+    return text, make_queue_kb(items, selected)
+
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/queue в модераторском чате: ожидающие посты с отметками."""
+    if update.effective_chat.id != _mod_chat_id():
+        return
+    text, kb = await _queue_screen()
+    await update.message.reply_text(text, reply_markup=kb)
+
+
+async def queue_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
+    items, selected = queue_selection(q.message.reply_markup)
+    _, args = decode(q.data)
+    post_id = int(args[0])
+    selected ^= {post_id}
+    await q.edit_message_reply_markup(reply_markup=make_queue_kb(items, selected))
 
-    parts = q.data.split(":")
-    if len(parts) < 2:
-        await q.edit_message_text("Некорректный callback.")
+
+async def queue_select_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    items, selected = queue_selection(q.message.reply_markup)
+    everything = {post_id for post_id, _ in items}
+    # второе нажатие снимает все отметки
+    selected = set() if selected == everything else everything
+    await q.edit_message_reply_markup(reply_markup=make_queue_kb(items, selected))
+
+
+async def _selected_or_alert(q) -> list[int]:
+    _, selected = queue_selection(q.message.reply_markup)
+    if not selected:
+        await q.answer("Ничего не отмечено.", show_alert=True)
+        return []
+    await q.answer()
+    return sorted(selected)
+
+
+async def queue_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Одобряет отмеченные посты одной транзакцией; публикует их воркер
+    очереди (publisher.py) за один проход. Сообщения модерации каждого
+    поста воркер обновит сам, когда пост выйдет.
+    """
+    q = update.callback_query
+    post_ids = await _selected_or_alert(q)
+    if not post_ids:
         return
-    user_id = int(parts[1])
+    approved = await run_write(approve_posts, post_ids)
+    if approved:
+        kick(context.job_queue)
+    text, kb = await _queue_screen()
+    await q.edit_message_text(f"✅ Одобрено: {len(approved)}, публикуются…\n\n{text}", reply_markup=kb)
 
-    delete_draft(user_id)
-    try:
-        await context.bot.send_message(user_id, "❌ Ваш пост отклонён модератором.")
-    except Exception:
-        pass
 
-    await q.edit_message_text("🚫 Отклонено модератором.")
+async def queue_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отклоняет отмеченные посты одной транзакцией, авторов уведомляет параллельно."""
+    q = update.callback_query
+    post_ids = await _selected_or_alert(q)
+    if not post_ids:
+        return
+    rejected = await run_write(reject_posts, post_ids)
+    text, kb = await _queue_screen()
+    await q.edit_message_text(f"🚫 Отклонено: {len(rejected)}\n\n{text}", reply_markup=kb)
+    calls = {}
+    for post_id, user_id, chat_id, msg_id in rejected:
+        calls[f"автор поста {post_id}"] = context.bot.send_message(
+            user_id, "❌ Ваш пост отклонён модератором."
+        )
+        if chat_id and msg_id:
+            calls[f"модерация поста {post_id}"] = context.bot.edit_message_text(
+                "🚫 Отклонено модератором.", chat_id=chat_id, message_id=msg_id
+            )
+    await fan_out(calls, limit=QUEUE_NOTIFY_PARALLEL, label="/queue")
+
+
+# --------------------- Модерация: история правок (/history) ---------------------
+HISTORY_LIMIT = 40        # последних правок в ответе (лимит длины сообщения)
+
+
+def _history_value(value: str | None) -> str:
+    if value is None:
+        return "удалено"
+    value = json.loads(value)
+    if isinstance(value, list):
+        value = ", ".join(map(str, value))
+    value = str(value)
+    return value if len(value) <= 40 else value[:39] + "…"
+
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/history <номер поста> в модераторском чате: как автор заполнял черновик."""
+    if update.effective_chat.id != _mod_chat_id():
+        return
+    if len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
+        await update.message.reply_text("Использование: /history <номер поста>")
+        return
+    post_id = int(context.args[0].lstrip("#"))
+    rows = await run_read(load_post_history, post_id)
+    if not rows:
+        await update.message.reply_text(f"У поста #{post_id} нет истории правок.")
+        return
+    lines = [
+        f"{time.strftime('%d.%m %H:%M', time.localtime(created_at))}  {key}: {_history_value(value)}"
+        for key, value, created_at in rows[-HISTORY_LIMIT:]
+    ]
+    header = f"📝 Правки черновика поста #{post_id}"
+    if len(rows) > HISTORY_LIMIT:
+        header += f" (последние {HISTORY_LIMIT} из {len(rows)})"
+    await update.message.reply_text("\n".join([header, *lines]))
+
+
+# --------------------- Очистка брошенных черновиков ---------------------
+DRAFT_SWEEP_BATCH = 50
+
+
+def _draft_ttl() -> float:
+    return float(os.getenv("DRAFT_TTL_HOURS", 48)) * 3600
+
+
+def _draft_expired_notice() -> bool:
+    return os.getenv("DRAFT_EXPIRED_NOTICE", "0") == "1"
+
+
+async def draft_lost(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Нажатие на шаге, до которого черновик уже не доходит (его удалил sweep
+    или он сброшен): вместо шага — сообщение, и диалог завершается обычным
+    путём (Wizard вызывает это перед маршрутом кнопки, см. Wizard.lost).
+    Так не срабатывает, например, «Опубликовать» на предпросмотре с пустым
+    user_data.
+    """
+    user_id = update.effective_user.id
+    context.user_data.clear()
+    await delete_draft_async(user_id)
+    _drop_albums(user_id)
+    await update.callback_query.answer()
+    await edit_text(
+        update.callback_query,
+        "⌛ Черновик поста удалён за давностью.\nЧтобы начать заново, отправьте /start.",
+    )
+    forget(update.effective_chat.id)
+    return ConversationHandler.END
+
+
+async def sweep_expired_drafts(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Job для JobQueue: удаляет черновики, которые не менялись дольше
+    DRAFT_TTL_HOURS, небольшими пачками (каждая — отдельная короткая
+    транзакция), чистит user_data этих пользователей и, если включено,
+    уведомляет их. Шаг диалога не трогается: следующее нажатие в нём
+    увидит пустой черновик и завершит диалог (draft_lost).
+    """
+    await flush_drafts()
+    cutoff = time.time() - _draft_ttl()
+    notice = _draft_expired_notice()
+    total = 0
+    while True:
+        user_ids = await run_write(expire_drafts, cutoff, DRAFT_SWEEP_BATCH)
+        for user_id in user_ids:
+            context.application.drop_user_data(user_id)
+            forget(user_id)
+            _drop_albums(user_id)
+            if notice:
+                try:
+                    await context.bot.send_message(
+                        user_id,
+                        "⌛ Ваш черновик поста удалён за давностью.\n"
+                        "Чтобы начать заново, отправьте /start.",
+                    )
+                except TelegramError as e:
+                    logger.info("Не удалось уведомить %s об удалении черновика: %s", user_id, e)
+        total += len(user_ids)
+        if len(user_ids) < DRAFT_SWEEP_BATCH:
+            break
+        await asyncio.sleep(0)   # отдаём цикл событий между пачками
+
+    if total:
+        logger.info("Удалено просроченных черновиков: %s", total)
 
 
 # --------------------- Универсальная отмена ---------------------
@@ -1398,6 +738,10 @@ logger = logging.getLogger(__name__)
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 🔥 КРИТИЧНО — чистим данные пользователя
     context.user_data.clear()
+    await delete_draft_async(update.effective_user.id)
+    _drop_albums(update.effective_user.id)
+    if update.effective_chat:
+        forget(update.effective_chat.id)
 
     logger.info(
         f"Conversation cancelled by user {update.effective_user.id}"
@@ -1412,7 +756,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         q = update.callback_query
         await q.answer()
         try:
-            await q.edit_message_text(text)
+            await edit_text(q, text)
         except Exception:
             await context.bot.send_message(
                 chat_id=update.effective_user.id,
@@ -1422,57 +766,180 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
-# --------------------- Алиасы для ConversationHandler ---------------------
-async def greeting_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Срабатывает, когда пользователь нажимает кнопку «➡️ Далее» на экране приветствия.
-    Здесь мы запускаем тот же сценарий, что и при /start post:
-    - очищаем список фото в user_data,
-    - отправляем сообщение «Шаг 1: Выберите водоём»
-      вместе с клавиатурой make_location_kb,
-    - переводим ConversationHandler в состояние LOCATION.
-    """
-    query = update.callback_query
-    await query.answer()                           # подтверждаем нажатие
-    await query.edit_message_reply_markup(None)     # убираем клавиатуру «Далее»
-
-    # Подготовка данных, как при /start post
-    context.user_data["photos"] = []
-
-# --------------------- Запуск сценария ---------------------
-async def start_post_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    context.user_data.clear()
-    context.user_data["photos"] = []
-
-    await query.message.reply_text(
-        "🎣 Шаг 1: Выберите водоём:",
-        reply_markup=make_location_kb()
-    )
-
-    return LOCATION
-
-
-    # Отправляем пользователю сообщение с клавиатурой выбора водоёма
-    await query.message.reply_text(
-        "🎣 Шаг 1: Выберите водоём:",
-        reply_markup=attach_nav(make_location_kb(), None, "POINT_TYPE")
-    )
+# --------------------- Запуск сценария: таблица шагов ---------------------
+# Порядок списка = порядок шагов: prev/next и номера «Шаг N» Wizard
+# проставляет сам. keys — данные шага, которые стираются, когда с него
+# уходят «Назад»; validate — алерт, если «Далее» нажата раньше времени.
+TEXT = filters.TEXT & ~filters.COMMAND
 
-    # Возвращаем состояние LOCATION, чтобы ConversationHandler знал, что делать дальше
-    return LOCATION
-
-async def detail_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    return await extra_param_text(update, context)
+DETAIL_PROMPTS = {
+    "poplavok": "🎣 Укажите глубину (например: 150 см.)",
+    "spin": "🎣 Укажите скорость проводки (например: 15)",
+    "donka": "🎣 Укажите клипсу (например: 15 м.)",
+    "trol": "🎣 Укажите клипсу (например: 30 м.)",
+    "pilk": "🎣 Укажите тип пилкинга (например: сильный)",
+}
 
-async def coords_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    return await coords_input(update, context)
+PHOTOS_TEXT = (
+    "📸 <b>Шаг {n}: Загрузите до 10 скриншотов.</b>\n\n"
+    "<b>Скриншоты должны включать:</b>\n"
+    "• 🎯 Место ловли\n"
+    "• 🎒 Садок\n"
+    "• 🧂 Прикорм\n"
+    "• 🗺 Карту точки\n"
+    "• 🎣 Сборку с наживкой\n\n"
+    "📤 Отправляйте скриншоты <b>обычными сообщениями</b>.\n"
+    "⚠️ Обязательно поставьте галочки:\n"
+    "• «Сжимать фото»\n"
+    "• «Группировать»\n\n"
+    "🚫 <b>Фотографии монитора не принимаются.</b>\n\n"
+    "Когда загрузите все изображения — нажмите «Подтвердить»."
+)
 
-async def comment_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # правильный вызов — comment_input (в коде есть comment_input)
-    return await comment_input(update, context)
+TEMP_LABELS = dict(TEMPS)
+
+
+def _require(key: str, alert: str):
+    return lambda data: None if data.get(key) else alert
+
+
+def _detail_text(data: dict, n) -> str:
+    return DETAIL_PROMPTS.get(data.get("fishing_type"), "🎣 Укажите параметр:")
+
+
+def _temp_text(data: dict, n) -> str:
+    text = f"🌡 <b>Шаг {n}:</b> Укажите температуру воды:"
+    label = TEMP_LABELS.get(data.get("temp"))
+    return f"{text}\n\nВы выбрали: <b>{label}</b>" if label else text
+
+
+def _preview_text(data: dict, n) -> str:
+    return f"Шаг {n}: Предпросмотр:\n\n" + build_post_text(data)
+
+
+def _fish_options(data: dict):
+    # рыба, введённая вручную, отмечается на кнопке «Написать самому»
+    fish = data.get("fish_type")
+    return make_fish_type_kb(fish if not fish or fish in FISHES else FISH_CUSTOM)
+
+
+wizard = Wizard([
+    Step(
+        "GREETING", GREETING,
+        "🎣 Приветствую, рыболов!\nНажмите «📮 Предложить пост», чтобы начать заново.",
+        options=lambda data: make_greeting_kb(),
+        actions=(("start_post", start_post_callback),),
+        chained=False, numbered=False,
+    ),
+    Step(
+        "LOCATION", LOCATION, "🎣 Шаг {n}: Выберите водоём:",
+        options=lambda data: make_location_kb(data.get("location")),
+        validate=_require("location", "Выберите водоём перед продолжением ⛔"),
+        keys=("location",),
+        actions=(("loc*", location_chosen),),
+        samples=tuple({"location": code} for code in [None, *ALL_LOCATIONS]),
+        prev="GREETING",
+    ),
+    Step(
+        "POINT_TYPE", POINT_TYPE, "🎣 Шаг {n}: Выберите тип точки:",
+        options=lambda data: make_point_type_kb(data.get("point_types")),
+        validate=_require("point_types", "Выберите хотя бы один тип точки перед продолжением."),
+        keys=("point_types",),
+        actions=(("pt*", point_type_chosen),),
+        samples=tuple(
+            {"point_types": list(chosen)}
+            for k in range(POINT_TYPES_MAX + 1)
+            for chosen in combinations([code for code, _ in POINT_TYPES], k)
+        ),
+    ),
+    Step(
+        "FISH_TYPE", FISH_TYPE, "🎣 Шаг {n}: Выберите вид рыбы:",
+        options=_fish_options,
+        validate=_require("fish_type", "Выберите рыбу или введите её вручную ⛔"),
+        keys=("fish_type",),
+        actions=(("fish*", fish_type_chosen),),
+        samples=tuple({"fish_type": fish} for fish in [None, *FISHES]),
+    ),
+    Step(
+        "FISHING_TYPE", FISHING_TYPE, "🎣 Шаг {n}: Выберите тип ловли:",
+        options=lambda data: make_fishing_type_kb(data.get("fishing_type")),
+        validate=_require("fishing_type", "Выберите тип ловли перед продолжением ⛔"),
+        keys=("fishing_type", "fishing"),
+        actions=(("ft*", fishing_type_chosen),),
+        samples=tuple({"fishing_type": key} for key in [None, *(key for _, key in FISHING_TYPES)]),
+    ),
+    Step(
+        "DETAIL", DETAIL, _detail_text,
+        validate=_require("fishing_extra", "Сначала введите значение ⛔"),
+        keys=("fishing_extra",),
+        inputs=(MessageHandler(TEXT, fishing_detail_input),),
+        numbered=False,
+    ),
+    Step(
+        "COORDS", COORDS, "📍 <b>Шаг {n}:</b> Введите координаты\nПример: <code>56:123</code>",
+        validate=_require("coords", "❗ Сначала введите координаты"),
+        keys=("coords",),
+        inputs=(MessageHandler(TEXT, coords_input),),
+    ),
+    Step(
+        "TEMP", TEMP, _temp_text,
+        options=lambda data: make_temp_kb(data.get("temp")),
+        validate=lambda data: None if "temp" in data else "Выберите температуру или нажмите «Пропустить» ⛔",
+        keys=("temp",),
+        actions=(("temp*", temp_chosen),),
+        samples=tuple({"temp": key} for key in [None, *(key for key, _ in TEMPS)]),
+    ),
+    Step(
+        "COMMENT", COMMENT, "📝 Шаг {n}: Добавьте комментарий (необязательно):",
+        options=lambda data: make_comment_kb(bool(data.get("comment"))),
+        next_label=lambda data: "✅ Подтвердить" if data.get("comment") else "➡️ Пропустить",
+        keys=("comment",),
+        actions=(("comment_write", comment_write),),
+        samples=({}, {"comment": "…"}),
+    ),
+    Step(
+        "AUTHOR", AUTHOR, "👤 Шаг {n}: Укажите свой игровой ник:",
+        keys=("author",),
+        inputs=(MessageHandler(TEXT, author_entered),),
+    ),
+    Step(
+        "PHOTOS", PHOTOS, PHOTOS_TEXT,
+        keys=("photos", "photo_uids"),
+        inputs=(MessageHandler(filters.PHOTO | filters.Document.IMAGE, photo_add),),
+        leave=_take_albums,
+    ),
+    Step(
+        "PREVIEW", PREVIEW, _preview_text,
+        options=lambda data: make_confirm_kb(),
+        actions=(
+            ("confirm_publish", confirm_publish),
+            ("confirm_cancel", confirm_cancel),
+        ),
+    ),
+], on_lost=draft_lost)
+
+
+# --------------------- Маршруты callback-кнопок ---------------------
+# Один CallbackRouter на состояние (строит Wizard по таблице шагов):
+# кнопки шага из actions + ровно те go_back:/go_next:, что есть на его экране.
+routers = wizard.routers
+
+moderation_router = CallbackRouter("MODERATION", [
+    ("mod_ok*", mod_approve),
+    ("mod_no*", mod_reject),
+    ("mq_t*", queue_toggle),
+    (encode("mq", "all"), queue_select_all),
+    (encode("mq", "ok"), queue_approve),
+    (encode("mq", "no"), queue_reject),
+])
+
+
+def check_callback_routes():
+    """Вызывается при старте: ищет кнопки без обработчика и маршруты без кнопок."""
+    # кнопки модерации и очереди строятся на лету — для проверки хватит образца
+    sample = {button.callback_data for row in make_queue_kb([(0, "")]).inline_keyboard for button in row}
+    emitted = registered_callback_data() | sample | {encode("mod_ok", 0), encode("mod_no", 0)}
+    check_routes([*routers.values(), moderation_router], emitted)
 
 
 # --------------------- ConversationHandler ---------------------
@@ -1482,76 +949,11 @@ conv_handler = ConversationHandler(
     ],
 
     states={
-        GREETING: [
-            CallbackQueryHandler(start_post_callback, pattern="^start_post$")
-        ],
-
-        LOCATION: [
-            CallbackQueryHandler(location_chosen, pattern="^loc_"),
-            CallbackQueryHandler(location_next, pattern="^nav_next$"),
-            CallbackQueryHandler(location_back, pattern="^nav_back$"),
-        ],
-
-        POINT_TYPE: [
-            CallbackQueryHandler(point_type_chosen, pattern=r"^(pt_|nav_)"),
-        ],
-
-        FISH_TYPE: [
-            CallbackQueryHandler(fish_type_chosen, pattern=r"^(fish_|nav_)"),
-        ],
-
-        FISH_TYPE_TEXT: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, fish_type_text)
-        ],
-
-        FISHING_TYPE: [
-            CallbackQueryHandler(fishing_type_chosen, pattern=r"^(ft_|nav_)"),
-            CallbackQueryHandler(go_back, pattern="^go_back:FISH_TYPE$"),
-            CallbackQueryHandler(go_next, pattern="^go_next:DETAIL$"),
-            CallbackQueryHandler(coords_start, pattern="^go_next:COORDS$")
-        ],
-
-        DETAIL: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, fishing_detail_input),
-            CallbackQueryHandler(go_back, pattern="^go_back:FISHING_TYPE$"),
-            CallbackQueryHandler(coords_start, pattern="^go_next:COORDS$")
-        ],
-
-        COORDS: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, coords_input),
-            CallbackQueryHandler(coords_chosen, pattern=r"^go_"),
-        ],
-
-
-        TEMP: [
-            CallbackQueryHandler(temp_chosen, pattern="^(temp_|go_)")
-        ],
-
-        PHOTOS: [
-            MessageHandler(filters.PHOTO | filters.Document.IMAGE, photo_add),
-            CallbackQueryHandler(photos_done_btn, pattern="^(go_|confirm_screenshots$)"),
-        ],
-
-        COMMENT: [
-            CallbackQueryHandler(comment_chosen, pattern="^comment_|^go_"),
-        ],
-
-        COMMENT_TEXT: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, comment_input)
-        ],
-
-        AUTHOR: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, author_entered),
-            CallbackQueryHandler(go_back, pattern="^go_back:COMMENT$"),
-            CallbackQueryHandler(photos_start, pattern="^go_next:PHOTOS$"),
-            CallbackQueryHandler(go_next, pattern="^go_next:PREVIEW$")
-        ],
-
-        PREVIEW: [
-            CallbackQueryHandler(confirm_publish, pattern="^confirm_publish$"),
-            CallbackQueryHandler(confirm_cancel, pattern="^confirm_cancel$"),
-            CallbackQueryHandler(go_back, pattern="^go_back:AUTHOR$")
-        ],
+        **wizard.states(),
+
+        # ввод текста вместо кнопки: после него — обратно на экран шага
+        FISH_TYPE_TEXT: [MessageHandler(TEXT, fish_type_text)],
+        COMMENT_TEXT: [MessageHandler(TEXT, comment_input)],
     },
 
     fallbacks=[
@@ -1560,5 +962,6 @@ conv_handler = ConversationHandler(
 
     allow_reentry=True,
     per_message=False,
+    name="post_wizard",
+    persistent=True,
 )
-
@@ -1,107 +1,270 @@
+from functools import cache
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from callbacks import encode, decode
 from locations import ALL_LOCATIONS   # словарь всех водоёмов
 
+# Реестр клавиатур мастера.
+# Вариантов у каждого экрана немного (20 водоёмов с отметкой, 11 наборов
+# типов точки, 6 типов ловли, 5 температур…), поэтому все они строятся
+# один раз при сборке мастера (Wizard прогревает экраны всех шагов, см.
+# wizard.py) и дальше отдаются из кэша. Здесь только варианты выбора —
+# строку «Назад / Далее» приклеивает attach_nav по таблице шагов. Объекты
+# InlineKeyboardMarkup в PTB неизменяемы, так что их можно переиспользовать,
+# а FrozenMarkup дополнительно запоминает свой to_dict() — повторная
+# отправка той же клавиатуры не обходит заново все кнопки.
+
+_serialized: dict[int, dict] = {}
+_registry: list[InlineKeyboardMarkup] = []
+
+
+class FrozenMarkup(InlineKeyboardMarkup):
+    """InlineKeyboardMarkup из реестра: сериализуется один раз."""
+
+    __slots__ = ()
+
+    def to_dict(self, recursive: bool = True) -> dict:
+        data = _serialized.get(id(self))
+        if data is None:
+            data = _serialized[id(self)] = super().to_dict(recursive=recursive)
+        return data
+
+
+def _markup(rows) -> FrozenMarkup:
+    markup = FrozenMarkup([list(row) for row in rows])
+    _registry.append(markup)
+    return markup
+
+
+def registered_callback_data() -> set[str]:
+    """Все callback_data кнопок из реестра (для проверки маршрутов при старте)."""
+    return {
+        button.callback_data
+        for markup in _registry
+        for row in markup.inline_keyboard
+        for button in row
+        if isinstance(button.callback_data, str)
+    }
+
+
+def _pairs(buttons):
+    """Раскладывает кнопки по две в строке."""
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+
+# ---------- Навигация go_back / go_next ----------
+NEXT_LABEL = "✅ Подтвердить"
 
-def make_location_kb() -> InlineKeyboardMarkup:
-    buttons, row = [], []
-    for code, title in ALL_LOCATIONS.items():
-        row.append(InlineKeyboardButton(title, callback_data=f"loc_{code}"))
-        if len(row) == 2:
-            buttons.append(row)
-            row = []
-    if row:
-        buttons.append(row)
-    return InlineKeyboardMarkup(buttons)
 
+def nav_kb_row(back: str | None = None, nxt: str | None = None, next_label: str = NEXT_LABEL):
+    """Возвращает строку кнопок навигации (неполная клавиатура)."""
+    row = []
+    if back:
+        row.append(InlineKeyboardButton("⬅️ Назад", callback_data=encode("go_back", back)))
+    if nxt:
+        row.append(InlineKeyboardButton(next_label, callback_data=encode("go_next", nxt)))
+    return row
 
-# ---------- Шаг 2: выбор типа точки (до 2 значений + кнопка «Задание») ----------
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
-def make_point_type_kb(selected: list[str] | None = None) -> InlineKeyboardMarkup:
+_nav_cache: dict[tuple[int, str | None, str | None, str], tuple] = {}
+
+
+def attach_nav(
+    kb: InlineKeyboardMarkup | None,
+    back: str | None = None,
+    nxt: str | None = None,
+    next_label: str = NEXT_LABEL,
+) -> InlineKeyboardMarkup:
     """
-    Клавиатура выбора типа точки с возможностью выбирать несколько.
-    selected — список уже выбранных ключей.
+    Приклеивает строку навигации к клавиатуре из реестра.
+    Если kb is None — создаёт только навигацию. Результат кэшируется.
     """
-    selected = selected or []
+    key = (id(kb), back, nxt, next_label)
+    hit = _nav_cache.get(key)
+    if hit is not None and hit[0] is kb:
+        return hit[1]
+
+    nav_row = nav_kb_row(back, nxt, next_label)
+    if not nav_row:
+        result = kb or _markup([])
+    elif kb is None:
+        result = _markup([nav_row])
+    else:
+        result = _markup([*kb.inline_keyboard, nav_row])
+    # храним и сам kb, чтобы его id не достался другому объекту
+    _nav_cache[key] = (kb, result)
+    return result
+
+
+# ---------- Старт ----------
+@cache
+def make_greeting_kb() -> InlineKeyboardMarkup:
+    return _markup([[InlineKeyboardButton("📮 Предложить пост", callback_data="start_post")]])
+
+
+# ---------- Шаг 1: водоём ----------
+def make_location_kb(selected: str | None = None) -> InlineKeyboardMarkup:
+    return _location_kb(selected if selected in ALL_LOCATIONS else None)
 
-    items = [
-        ("farm", "Фарм"),
-        ("trof", "Трофей"),
-        ("vys",  "Высед"),
-        ("spot", "Задание"),
+
+@cache
+def _location_kb(selected: str | None) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(f"✅ {name}" if code == selected else name, callback_data=f"loc_{code}")
+        for code, name in ALL_LOCATIONS.items()
     ]
+    return _markup(_pairs(buttons))
 
-    rows = []
-    for key, title in items:
-        # ✅ зелёная галочка если пункт выбран
-        label = f"{'✅ ' if key in selected else ''}{title}"
-        rows.append([InlineKeyboardButton(label, callback_data=f"pt_{key}")])
 
-    rows.append([InlineKeyboardButton("➡️ Далее", callback_data="pt_next")])
-    return InlineKeyboardMarkup(rows)
+# ---------- Шаг 2: тип точки (можно выбрать до двух) ----------
+POINT_TYPES = [
+    ("farm", "Фарм"),
+    ("trophy", "Трофей"),
+    ("vysek", "Высед"),
+    ("quest", "Задание"),
+]
+POINT_TYPES_MAX = 2
 
 
+def make_point_type_kb(selected=None) -> InlineKeyboardMarkup:
+    return _point_type_kb(frozenset(selected or ()))
 
-# --- Виды рыбы ---
-def make_fish_type_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("Разнорыбица 🐟", callback_data="fv_mix")],
-        [InlineKeyboardButton("Написать самому ✍️", callback_data="fv_custom")]
-    ])
 
+@cache
+def _point_type_kb(selected: frozenset) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(f"✅ {label}" if code in selected else label, callback_data=f"pt_{code}")
+        for code, label in POINT_TYPES
+    ]
+    return _markup(_pairs(buttons))
 
-# --- Тип ловли ---
-def make_fishing_type_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("Донка",    callback_data="ft_donka")],
-        [InlineKeyboardButton("Поплавок", callback_data="ft_poplavok")],
-        [InlineKeyboardButton("Спиннинг", callback_data="ft_spin")],
-        [InlineKeyboardButton("Троллинг", callback_data="ft_trol")],
-        [InlineKeyboardButton("Пилкинг",  callback_data="ft_pilk")],
-    ])
 
+# ---------- Шаг 3: вид рыбы ----------
+FISH_CUSTOM = "Написать самому"     # рыба вводится текстом
+FISHES = ["Разнорыбица", FISH_CUSTOM]
 
-def make_coordinates_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("Троллинг", callback_data="coord_trol")],
-        [InlineKeyboardButton("Написать координаты", callback_data="coord_custom")],
-    ])
 
+def make_fish_type_kb(selected: str | None = None) -> InlineKeyboardMarkup:
+    return _fish_type_kb(selected if selected in FISHES else None)
 
-def make_temp_kb():
-    """
-    Клавиатура для выбора температуры с кнопкой 'Пропустить'.
-    Возвращает InlineKeyboardMarkup с кнопками tmp_norm/tmp_high/tmp_low/tmp_skip.
-    """
-    keyboard = [
-        [InlineKeyboardButton("Нормальная", callback_data="tmp_norm"),
-         InlineKeyboardButton("Повышенная", callback_data="tmp_high")],
-        [InlineKeyboardButton("Пониженная", callback_data="tmp_low")],
-        # Кнопка пропустить в отдельном ряду
-        [InlineKeyboardButton("⏭ Пропустить", callback_data="tmp_skip")]
+
+@cache
+def _fish_type_kb(selected: str | None) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(f"✅ {fish}" if fish == selected else fish, callback_data=f"fish_{fish}")
+        for fish in FISHES
+    ]
+    return _markup(_pairs(buttons))
+
+
+# ---------- Шаг 4: тип ловли ----------
+FISHING_TYPES = [
+    ("Донка", "donka"),
+    ("Поплавок", "poplavok"),
+    ("Спиннинг", "spin"),
+    ("Троллинг", "trol"),
+    ("Пилкинг", "pilk"),
+]
+
+
+def make_fishing_type_kb(selected: str | None = None) -> InlineKeyboardMarkup:
+    known = {key for _, key in FISHING_TYPES}
+    return _fishing_type_kb(selected if selected in known else None)
+
+
+@cache
+def _fishing_type_kb(selected: str | None) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(f"{'✅ ' if selected == key else ''}{label}", callback_data=f"ft_{key}")
+        for label, key in FISHING_TYPES
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return _markup(_pairs(buttons))
+
 
+# ---------- Шаг 6: температура ----------
+TEMPS = [
+    ("high", "Повышенная"),
+    ("low", "Пониженная"),
+    ("normal", "Нормальная"),
+    ("skip", "Пропустить"),
+]
 
-def make_photo_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([[InlineKeyboardButton("📸 Загрузить", callback_data="photo_start")]])
 
+def make_temp_kb(selected: str | None = None) -> InlineKeyboardMarkup:
+    return _temp_kb(selected if selected in dict(TEMPS) else None)
 
-def make_comment_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([[InlineKeyboardButton("Пропустить", callback_data="comment_skip")]])
 
+@cache
+def _temp_kb(selected: str | None) -> InlineKeyboardMarkup:
+    return _markup(_pairs([
+        InlineKeyboardButton(f"✅ {label}" if key == selected else label, callback_data=f"temp_{key}")
+        for key, label in TEMPS
+    ]))
 
+
+# ---------- Шаг 7: комментарий ----------
+@cache
+def make_comment_kb(has_comment: bool = False) -> InlineKeyboardMarkup | None:
+    """Кнопка «Написать комментарий» (пока комментария нет)."""
+    if has_comment:
+        return None
+    return _markup([[InlineKeyboardButton("✏️ Написать комментарий", callback_data="comment_write")]])
+
+
+# ---------- Шаг 10: предпросмотр ----------
+@cache
 def make_confirm_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
+    return _markup([
         [InlineKeyboardButton("✅ Опубликовать (на модерацию)", callback_data="confirm_publish")],
         [InlineKeyboardButton("❌ Отмена", callback_data="confirm_cancel")],
     ])
 
 
-def make_moderation_kb(user_id: int) -> InlineKeyboardMarkup:
+# ---------- Модерация ----------
+def make_moderation_kb(post_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
         [
-            InlineKeyboardButton("👍 Одобрить", callback_data=f"mod_ok:{user_id}"),
-            InlineKeyboardButton("🚫 Отклонить", callback_data=f"mod_no:{user_id}")
+            InlineKeyboardButton("👍 Одобрить", callback_data=encode("mod_ok", post_id)),
+            InlineKeyboardButton("🚫 Отклонить", callback_data=encode("mod_no", post_id))
         ]
     ])
+
+
+# ---------- Модерация: очередь (/queue) ----------
+# Отметки хранятся в самой клавиатуре (☑/☐ в тексте кнопки): состояние
+# выбора не надо держать в chat_data, и два модератора не мешают друг другу.
+QUEUE_CHECKED, QUEUE_UNCHECKED = "☑", "☐"
+
+
+def make_queue_kb(items: list[tuple[int, str]], selected=frozenset()) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(
+            f"{QUEUE_CHECKED if post_id in selected else QUEUE_UNCHECKED} {label}",
+            callback_data=encode("mq_t", post_id),
+        )]
+        for post_id, label in items
+    ]
+    rows.append([InlineKeyboardButton("☑ Выбрать все", callback_data=encode("mq", "all"))])
+    rows.append([
+        InlineKeyboardButton("👍 Одобрить выбранные", callback_data=encode("mq", "ok")),
+        InlineKeyboardButton("🚫 Отклонить выбранные", callback_data=encode("mq", "no")),
+    ])
+    return InlineKeyboardMarkup(rows)
+
+
+def queue_selection(markup: InlineKeyboardMarkup | None) -> tuple[list[tuple[int, str]], set[int]]:
+    """Обратно из клавиатуры очереди: [(post_id, подпись)] и отмеченные post_id."""
+    items, selected = [], set()
+    for row in markup.inline_keyboard if markup else ():
+        for button in row:
+            if not isinstance(button.callback_data, str):
+                continue
+            prefix, args = decode(button.callback_data)
+            if prefix != "mq_t" or not args or not args[0].isdigit():
+                continue
+            post_id = int(args[0])
+            mark, _, label = button.text.partition(" ")
+            items.append((post_id, label))
+            if mark == QUEUE_CHECKED:
+                selected.add(post_id)
+    return items, selected
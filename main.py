@@ -1,6 +1,7 @@
 import telegram
 print("PTB VERSION:", telegram.__version__)
 
+import asyncio
 import logging
 import os
 from dotenv import load_dotenv
@@ -8,13 +9,21 @@ from dotenv import load_dotenv
 from telegram.ext import (
     Application,
     ApplicationBuilder,
-    CallbackQueryHandler,
     CommandHandler,
 )
-from telegram.request import HTTPXRequest
 
-from database import init_db
-from handlers import conv_handler, mod_approve, mod_reject
+from database import init_db, close_db, flush_drafts, load_update_hwm
+from dedup import UpdateDedup
+from handlers import (
+    conv_handler, moderation_router, check_callback_routes, sweep_expired_drafts, queue_command,
+    history_command,
+)
+from persistence import SQLitePersistence
+from publisher import drain_outbox, PUBLISH_POLL
+from processing import PerUserUpdateProcessor
+from ratelimit import PriorityRateLimiter
+from transport import RoutedRequest
+from webhook import InlineAnswerApplication, InlineAnswerBot, serve_webhook
 
 load_dotenv()
 
@@ -28,8 +37,23 @@ async def test_start(update, context):
     await update.message.reply_text("Бот жив и принимает апдейты ✅")
 
 
+# повторно доставленные Telegram апдейты (по update_id) не обрабатываются дважды
+dedup = UpdateDedup()
+
+
+async def save_dedup(context):
+    await dedup.save()
+
+
+async def on_shutdown(app: Application):
+    await flush_drafts()
+    await dedup.save()
+    close_db()
+
+
 def main():
     init_db()
+    dedup.restore(load_update_hwm())
 
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     webhook_url = os.getenv("WEBHOOK_URL")
@@ -43,33 +67,64 @@ def main():
         logger.error("❌ Нет WEBHOOK_URL")
         return
 
-    request = HTTPXRequest(
-        connect_timeout=30,
-        read_timeout=120,
-    )
+    # короткие вызовы и загрузка медиа — в разных пулах соединений (transport.py)
+    request = RoutedRequest()
+
+    # WEBHOOK_INLINE_ANSWER=1 — ответ на нажатие кнопки уходит в теле
+    # ответа вебхука, без отдельного запроса answerCallbackQuery (webhook.py)
+    inline_answer = os.getenv("WEBHOOK_INLINE_ANSWER", "0") == "1"
 
-    app: Application = (
+    builder = (
         ApplicationBuilder()
-        .token(token)
-        .request(request)
-        .build()
+        .persistence(SQLitePersistence())
+        # разные пользователи — параллельно, один пользователь — по порядку
+        .concurrent_updates(PerUserUpdateProcessor(int(os.getenv("MAX_CONCURRENT_UPDATES", 64)), dedup))
+        .post_shutdown(on_shutdown)
     )
+    # лимиты Telegram с приоритетом ответов пользователю над публикациями
+    rate_limiter = PriorityRateLimiter()
+    if inline_answer:
+        builder = (
+            builder
+            .bot(InlineAnswerBot(token, request=request, rate_limiter=rate_limiter))
+            .application_class(InlineAnswerApplication)
+        )
+    else:
+        builder = builder.token(token).request(request).rate_limiter(rate_limiter)
+    app: Application = builder.build()
 
     # Основной диалог
     app.add_handler(conv_handler)
 
     # Модерация
-    app.add_handler(CallbackQueryHandler(mod_approve, pattern=r"^mod_ok:"))
-    app.add_handler(CallbackQueryHandler(mod_reject, pattern=r"^mod_no:"))
+    app.add_handler(moderation_router)
+    app.add_handler(CommandHandler("queue", queue_command))
+    app.add_handler(CommandHandler("history", history_command))
+
+    check_callback_routes()
+
+    # Очистка брошенных черновиков
+    app.job_queue.run_repeating(sweep_expired_drafts, interval=15 * 60, first=60)
+
+    # high-water mark для отсева повторных апдейтов после рестарта
+    app.job_queue.run_repeating(save_dedup, interval=10, first=10)
+
+    # Публикация одобренных постов (и недоделанное до перезапуска)
+    app.job_queue.run_repeating(drain_outbox, interval=PUBLISH_POLL, first=1)
 
     logger.info("🚀 Bot starting with webhook…")
 
-    app.run_webhook(
+    # вебхук отвечает сразу, апдейты ждут в ограниченной очереди (webhook.py)
+    asyncio.run(serve_webhook(
+        app,
         listen="0.0.0.0",
         port=port,
         url_path="webhook",        # ← путь ТОЛЬКО здесь
         webhook_url=webhook_url,   # ← БЕЗ /webhook
-    )
+        secret_token=os.getenv("WEBHOOK_SECRET") or None,   # и пароль к /metrics
+        inline_answer=inline_answer,
+        queue_size=int(os.getenv("WEBHOOK_QUEUE_MAX", 1000)),
+    ))
 
 
 if __name__ == "__main__":
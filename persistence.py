@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import (
+    run_read, run_write, save_ptb_state,
+    load_ptb_user_data, load_ptb_chat_data, load_ptb_bot_data, load_ptb_conversations,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранит состояние Application (user_data, chat_data, bot_data и шаги
+    ConversationHandler) в той же SQLite базе, что и черновики.
+
+    - Запись пакетная: Application раз в update_interval отдаёт изменения,
+      они копятся в памяти и уходят в БД одной транзакцией.
+    - Application отдаёт user_data всех пользователей на каждом проходе;
+      в БД уходят только те, чей JSON отличается от последнего записанного.
+    - Чтение ленивое: при старте грузятся только bot_data и шаги диалогов,
+      а user_data/chat_data конкретного пользователя подтягиваются
+      в refresh_* при его первом апдейте после рестарта.
+    """
+
+    def __init__(self, update_interval: float = 10):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval,
+        )
+        self._user_data: dict[int, str | None] = {}
+        self._chat_data: dict[int, str | None] = {}
+        self._bot_data: str | None = None
+        self._conversations: dict[tuple[str, str], str | None] = {}
+        # последнее, что лежит в БД (записано или прочитано)
+        self._saved_users: dict[int, str] = {}
+        self._saved_chats: dict[int, str] = {}
+        self._saved_bot: str | None = None
+        self._loaded_users: set[int] = set()
+        self._loaded_chats: set[int] = set()
+        self._commit_task: asyncio.Task | None = None
+
+    # ---------- запись ----------
+    async def _commit(self):
+        # Пока есть что писать — пишем; всё, что пришло во время записи,
+        # уйдёт следующей транзакцией того же цикла.
+        while self._user_data or self._chat_data or self._bot_data or self._conversations:
+            user_data, self._user_data = self._user_data, {}
+            chat_data, self._chat_data = self._chat_data, {}
+            bot_data, self._bot_data = self._bot_data, None
+            conversations, self._conversations = self._conversations, {}
+            await run_write(save_ptb_state, user_data, chat_data, bot_data, conversations)
+            for saved, written in ((self._saved_users, user_data), (self._saved_chats, chat_data)):
+                for key, value in written.items():
+                    if value is None:
+                        saved.pop(key, None)
+                    else:
+                        saved[key] = value
+            if bot_data is not None:
+                self._saved_bot = bot_data
+
+    async def _schedule_commit(self):
+        # Все update_* из одного прогона Application.update_persistence
+        # успевают положить данные до того, как задача начнёт писать.
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.create_task(self._commit())
+        await asyncio.shield(self._commit_task)
+
+    @staticmethod
+    def _changed(pending: dict, saved: dict, key: int, value: str) -> bool:
+        # в очереди другое значение — новое должно его перекрыть
+        return key in pending or saved.get(key) != value
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        value = json.dumps(data, ensure_ascii=False)
+        if self._changed(self._user_data, self._saved_users, user_id, value):
+            self._user_data[user_id] = value
+            await self._schedule_commit()
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        value = json.dumps(data, ensure_ascii=False)
+        if self._changed(self._chat_data, self._saved_chats, chat_id, value):
+            self._chat_data[chat_id] = value
+            await self._schedule_commit()
+
+    async def update_bot_data(self, data: dict) -> None:
+        value = json.dumps(data, ensure_ascii=False)
+        if self._bot_data is not None or value != self._saved_bot:
+            self._bot_data = value
+            await self._schedule_commit()
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        state = json.dumps(new_state) if new_state is not None else None
+        self._conversations[(name, json.dumps(list(key)))] = state
+        await self._schedule_commit()
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._user_data[user_id] = None
+        await self._schedule_commit()
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._chat_data[chat_id] = None
+        await self._schedule_commit()
+
+    async def flush(self) -> None:
+        await self._schedule_commit()
+
+    # ---------- чтение ----------
+    async def get_user_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        data = await run_read(load_ptb_bot_data)
+        self._saved_bot = data
+        return json.loads(data) if data else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await run_read(load_ptb_conversations, name)
+        logger.info("Restored %s conversations for %s", len(rows), name)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        data = await run_read(load_ptb_user_data, user_id)
+        self._loaded_users.add(user_id)
+        if data and not user_data:
+            user_data.update(json.loads(data))
+            self._saved_users.setdefault(user_id, data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        if chat_id in self._loaded_chats:
+            return
+        data = await run_read(load_ptb_chat_data, chat_id)
+        self._loaded_chats.add(chat_id)
+        if data and not chat_data:
+            chat_data.update(json.loads(data))
+            self._saved_chats.setdefault(chat_id, data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
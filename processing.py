@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Awaitable, Hashable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from callbacks import decode
+from dedup import UpdateDedup
+
+logger = logging.getLogger(__name__)
+
+# ---------- Параллельная обработка апдейтов ----------
+# По умолчанию PTB обрабатывает апдейты строго по одному, и медленный
+# send_media_group в mod_approve держит клики всех остальных пользователей.
+# Здесь апдейты разных пользователей идут параллельно, а апдейты одного
+# пользователя (и решения по одному посту модерации) — по очереди, в порядке
+# прихода: шаг ConversationHandler и черновик пользователя никогда не
+# меняются двумя апдейтами сразу.
+
+MODERATION_PREFIXES = ("mod_ok", "mod_no")
+# кнопки-переключатели: повторное нажатие только меняет отметку на экране
+TOGGLE_PREFIXES = ("loc", "pt", "temp", "mq_t")
+# кнопки с теми же префиксами, которые ведут дальше по мастеру, — не переключатели
+NOT_TOGGLES = frozenset({"temp_skip"})
+
+
+def update_key(update: object) -> Hashable | None:
+    """Ключ очереди: пост модерации, пользователь или чат. None — без очереди."""
+    if not isinstance(update, Update):
+        return None
+    q = update.callback_query
+    if q and isinstance(q.data, str):
+        prefix, args = decode(q.data)
+        if prefix in MODERATION_PREFIXES and args:
+            return ("post", args[0])
+    if update.effective_user:
+        return ("user", update.effective_user.id)
+    if update.effective_chat:
+        return ("chat", update.effective_chat.id)
+    return None
+
+
+def is_toggle(update: object) -> bool:
+    """Нажатие кнопки-переключателя (водоём, тип точки, температура, отметка в /queue)."""
+    if not isinstance(update, Update) or not update.callback_query:
+        return False
+    data = update.callback_query.data
+    return isinstance(data, str) and data not in NOT_TOGGLES and decode(data)[0] in TOGGLE_PREFIXES
+
+
+MAX_WAITING = 1024   # апдейтов, которые могут ждать очереди своего ключа
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельно до max_concurrent_updates апдейтов, но по одному на ключ
+    (update_key). Слот обработки (_running) берётся уже под замком ключа,
+    так что пользователь, закидавший бота кликами, занимает один слот, а не
+    все. Семафор базового класса — только общий предел апдейтов внутри
+    процессора (работающие + max_waiting ждущих своей очереди).
+    asyncio.Lock будит ожидающих в порядке FIFO — порядок апдейтов
+    одного пользователя сохраняется. Повторно доставленные апдейты
+    (dedup.py) отбрасываются до всех очередей.
+    """
+
+    __slots__ = ("_locks", "_dedup", "_running")
+
+    def __init__(self, max_concurrent_updates: int = 64, dedup: UpdateDedup | None = None,
+                 max_waiting: int = MAX_WAITING):
+        super().__init__(max_concurrent_updates + max_waiting)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # ключ -> [lock, сколько апдейтов его ждут или держат]
+        self._locks: dict[Hashable, list] = {}
+        self._dedup = dedup
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        if self._dedup is None or not isinstance(update, Update):
+            await self._process_keyed(update, coroutine)
+            return
+        if not self._dedup.start(update.update_id):
+            logger.info("Апдейт %s уже обрабатывался — повтор пропущен", update.update_id)
+            coroutine.close()
+            return
+        try:
+            await self._process_keyed(update, coroutine)
+        finally:
+            self._dedup.done(update.update_id)
+
+    async def _process_keyed(self, update: object, coroutine: Awaitable) -> None:
+        key = update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
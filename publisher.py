@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from html import escape
+
+from telegram import Bot, InputMediaPhoto
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import ContextTypes, JobQueue
+
+from database import (
+    run_write, claim_publications, mark_published, retry_publication, abandon_publication,
+    archive_post,
+)
+from fanout import fan_out
+from keyboards import make_moderation_kb
+from ratelimit import BULK
+from render import build_post_text
+
+logger = logging.getLogger(__name__)
+
+# ---------- Публикация одобренных постов ----------
+# mod_approve не шлёт в канал сам: он переводит пост в approved и кладёт
+# задачу в publish_outbox (одной транзакцией), а этот воркер разбирает
+# очередь пачками. Ошибка сети — повтор с экспоненциальной задержкой,
+# перезапуск бота — задача остаётся в БД и доедет после старта.
+# Ошибки, которые повтором не лечатся (BadRequest, Forbidden), и исчерпанные
+# попытки возвращают пост модераторам с кнопками — молча он не пропадает.
+# Сразу после отправки в канал задача получает отметку (mark_published):
+# если потом упадёт архив или БД, повтор только допишет архив.
+
+PUBLISH_BATCH = 20        # задач за один заход в БД
+PUBLISH_CONCURRENCY = 4   # постов в работе одновременно: порядок в канале не гарантирован
+PUBLISH_LEASE = 300       # сек: задача, взятая упавшим процессом, вернётся через столько
+RETRY_BASE = 5            # сек: 5, 10, 20, 40 … до RETRY_MAX
+RETRY_MAX = 30 * 60
+MAX_ATTEMPTS = 10
+PUBLISH_POLL = 30         # сек: плановый проход по очереди (повторы, задачи после рестарта)
+
+SUGGEST_LINK = "\n\n📨 <b><a href='https://t.me/MazaiiBot?start=post'>ПРЕДЛОЖИТЬ ПОСТ</a></b>"
+
+_QUIET = {"disable_notification": True, "protect_content": True}
+_BULK = {"rate_limit_args": {"priority": BULK}}   # канал уступает нажатиям пользователей
+
+_draining = asyncio.Lock()
+_again = False
+
+
+def _channel():
+    return os.getenv("CHANNEL_ID") or os.getenv("MAIN_CHANNEL_ID")
+
+
+def backoff(attempts: int) -> float:
+    """Задержка перед попыткой attempts+1 (с разбросом ±20%, чтобы посты не шли стаей)."""
+    return min(RETRY_MAX, RETRY_BASE * 2 ** attempts) * random.uniform(0.8, 1.2)
+
+
+def _photos(data: dict) -> list[str]:
+    photos = data.get("photos") or []
+    if isinstance(photos, str):
+        return [photos]
+    return list(photos)
+
+
+def _chat_ref(chat):
+    """CHANNEL_ID из окружения: числовой id — int, @username — как есть."""
+    chat = str(chat)
+    return int(chat) if chat.lstrip("-").isdigit() else chat
+
+
+async def send_post(bot: Bot, chat_id, data: dict) -> list[int]:
+    """Пост в канал: текст, одно фото или медиагруппа. Возвращает id сообщений."""
+    text = build_post_text(data) + SUGGEST_LINK
+    photos = _photos(data)
+    if len(photos) > 1:
+        media = [InputMediaPhoto(media=photos[0], caption=text, parse_mode="HTML")]
+        media += [InputMediaPhoto(media=pid) for pid in photos[1:]]
+        sent = await bot.send_media_group(chat_id=chat_id, media=media, **_QUIET, **_BULK)
+    elif photos:
+        sent = [await bot.send_photo(chat_id=chat_id, photo=photos[0], caption=text,
+                                     parse_mode="HTML", **_QUIET, **_BULK)]
+    else:
+        sent = [await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
+                                       **_QUIET, **_BULK)]
+    return [m.message_id for m in sent]
+
+
+async def copy_post(bot: Bot, chat_id, job: dict, data: dict) -> list[int] | None:
+    """
+    Копирует фото поста из модераторской: Telegram не загружает их
+    второй раз. У альбома copyMessages не меняет подпись, поэтому ссылка
+    «ПРЕДЛОЖИТЬ ПОСТ» дописывается правкой подписи первого фото.
+    None — копировать нечего (пост без фото или отправлен до этой версии).
+    """
+    ids = json.loads(job["mod_post_ids"] or "[]")
+    photos = _photos(data)
+    if not (photos and job["mod_chat_id"]) or len(ids) != len(photos):
+        return None
+    text = build_post_text(data) + SUGGEST_LINK
+    if len(ids) == 1:
+        copied = [await bot.copy_message(chat_id, job["mod_chat_id"], ids[0], caption=text,
+                                         parse_mode="HTML", **_QUIET, **_BULK)]
+    else:
+        copied = await bot.copy_messages(chat_id, job["mod_chat_id"], ids, **_QUIET, **_BULK)
+        try:
+            await bot.edit_message_caption(chat_id=chat_id, message_id=copied[0].message_id,
+                                           caption=text, parse_mode="HTML", **_BULK)
+        except TelegramError as e:
+            # альбом уже в канале: без ссылки лучше, чем повторная публикация
+            logger.warning("Пост скопирован, но подпись не обновилась: %s", e)
+    return [m.message_id for m in copied]
+
+
+async def _edit_moderation(bot: Bot, job: dict, text: str, reply_markup=None):
+    chat_id, msg_id = job["mod_chat_id"], job["mod_message_id"]
+    if not (chat_id and msg_id):
+        logger.warning("Для поста %s не сохранено сообщение модерации", job["post_id"])
+        return
+    await bot.edit_message_text(
+        chat_id=chat_id, message_id=msg_id, text=text,
+        reply_markup=reply_markup, parse_mode="HTML",
+    )
+
+
+async def _give_up(bot: Bot, job: dict, error: Exception):
+    post_id = job["post_id"]
+    logger.error("Пост %s не опубликован, возвращаем модераторам: %s", post_id, error)
+    await run_write(abandon_publication, post_id)
+    await fan_out({
+        "сообщение модерации": _edit_moderation(
+            bot, job,
+            f"⚠️ Не удалось опубликовать пост: {escape(str(error))}\n\nОдобрить пост ещё раз?",
+            make_moderation_kb(post_id),
+        ),
+    }, label=f"пост {post_id}")
+
+
+async def _send_to_channel(bot: Bot, job: dict) -> tuple[int | str | None, list[int]]:
+    post_id = job["post_id"]
+    channel = _channel()
+    if not channel:
+        return None, []
+    data = json.loads(job["data"])
+    try:
+        ids = await copy_post(bot, channel, job, data)
+    except BadRequest as e:
+        # сообщение в модераторской удалено и т.п. — отправляем фото заново
+        logger.warning("Пост %s: не скопировался из модераторской (%s)", post_id, e)
+        ids = None
+    if ids is None:
+        ids = await send_post(bot, channel, data)
+    return _chat_ref(channel), ids
+
+
+async def _failed(bot: Bot, job: dict, error: Exception, sent: bool):
+    """
+    Записывает неудачную попытку. Пока пост не в канале, неисправимая ошибка
+    или исчерпанные попытки возвращают его модераторам; после отправки —
+    только повтор: дописать архив, но не публиковать второй раз.
+    """
+    post_id = job["post_id"]
+    attempts = job["attempts"] + 1
+    if not sent and (isinstance(error, (BadRequest, Forbidden)) or attempts >= MAX_ATTEMPTS):
+        await _give_up(bot, job, error)
+        return
+    delay = backoff(job["attempts"])
+    if isinstance(error, RetryAfter):
+        delay = max(delay, error.retry_after)
+    logger.warning("Пост %s: попытка %s не удалась (%s), повтор через %.0f с",
+                   post_id, attempts, error, delay,
+                   exc_info=not isinstance(error, TelegramError))
+    await run_write(retry_publication, post_id, delay, str(error))
+
+
+async def _publish(bot: Bot, job: dict):
+    post_id = job["post_id"]
+    sent = job["channel_message_ids"] is not None
+    try:
+        if sent:
+            chat_id, ids = job["channel_id"], json.loads(job["channel_message_ids"])
+        else:
+            chat_id, ids = await _send_to_channel(bot, job)
+            sent = True
+            # отметка до архива и уведомлений: что бы ни упало дальше, повтор
+            # задачи пост в канал уже не отправит
+            await run_write(mark_published, post_id, chat_id, ids)
+        # --- в архив (и статус published, задача снимается) ---
+        await run_write(archive_post, post_id, chat_id, ids)
+    except Exception as e:
+        await _failed(bot, job, e, sent)
+        return
+
+    # --- автору и в модераторскую — параллельно, друг от друга не зависят ---
+    await fan_out({
+        "сообщение автору": bot.send_message(chat_id=job["user_id"], text="✅ Ваш пост опубликован."),
+        "сообщение модерации": _edit_moderation(bot, job, "✅ Пост одобрен и опубликован."),
+    }, label=f"пост {post_id}")
+
+
+async def drain_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Job для JobQueue: публикует всё, чему подошёл срок, по PUBLISH_CONCURRENCY
+    постов одновременно. Если воркер уже работает, новый вызов только
+    просит его сделать ещё один круг.
+    """
+    global _again
+    if _draining.locked():
+        _again = True
+        return
+    async with _draining:
+        while True:
+            _again = False
+            jobs = await run_write(claim_publications, PUBLISH_BATCH, PUBLISH_LEASE)
+            # упавшая задача вернётся сама, когда истечёт PUBLISH_LEASE
+            await fan_out(
+                {f"пост {job['post_id']}": _publish(context.bot, job) for job in jobs},
+                limit=PUBLISH_CONCURRENCY, label="публикация",
+            )
+            if len(jobs) < PUBLISH_BATCH and not _again:
+                break
+
+
+def kick(job_queue: JobQueue):
+    """Разобрать очередь сейчас, не дожидаясь планового прохода."""
+    job_queue.run_once(drain_outbox, 0)
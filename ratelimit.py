@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# ---------- Ограничение исходящих запросов ----------
+# Лимиты Telegram: ~30 сообщений в секунду на бота, ~1 в секунду в личный
+# чат и 20 в минуту в группу/канал. Лимиты чатов — на новые сообщения,
+# поэтому из ведра своего чата токен берут только send*/copy*/forward*;
+# правки, ответы на нажатия и прочее идут только через общее ведро.
+# Общее ведро раздаёт токены по приоритету: всё по умолчанию INTERACTIVE,
+# публикация в канал помечает свои запросы BULK (rate_limit_args) и
+# пропускает нажатия вперёд. RetryAfter ставит на паузу ведро чата (или
+# общее) и повторяет запрос сам.
+
+INTERACTIVE, BULK = 0, 1
+
+# Запросы, которые отправляют сразу несколько сообщений: стоят по токену
+# на каждое (поле со списком сообщений запроса)
+BATCH_FIELDS = {"sendMediaGroup": "media", "copyMessages": "message_ids", "forwardMessages": "message_ids"}
+
+
+def creates_messages(endpoint: str) -> bool:
+    """Запрос добавляет сообщения в чат (на такие действуют лимиты чата)."""
+    return endpoint.startswith(("send", "copy", "forward")) and endpoint != "sendChatAction"
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, cost: float = 1) -> float:
+        """Сколько секунд ждать, пока хватит токенов (0 — можно сейчас)."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        # за время паузы токены не копятся: пополнение считается с её конца
+        self.stamp = max(self.stamp, self.paused_until)
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        # запрос дороже всего ведра (большой альбом) ждёт полное ведро и уводит его в минус
+        need = min(cost, self.capacity) - self.tokens
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self, cost: float = 1):
+        self.tokens -= cost
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+
+def _cost(endpoint: str, data: dict) -> int:
+    field = BATCH_FIELDS.get(endpoint)
+    return (len(data.get(field) or ()) or 1) if field else 1
+
+
+async def _take(bucket: TokenBucket, cost: float):
+    while (delay := bucket.delay(cost)) > 0:
+        await asyncio.sleep(delay)
+    bucket.take(cost)
+
+
+class _Chat:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()   # очередь запросов одного чата — по порядку
+
+
+class PriorityRateLimiter(BaseRateLimiter[dict]):
+    """
+    rate_limit_args={"priority": BULK} в методе бота — фоновый запрос,
+    который уступает общее ведро всем INTERACTIVE (приоритет по умолчанию).
+    """
+
+    MAX_CHATS = 10_000   # после этого неактивные вёдра чатов выбрасываются
+
+    def __init__(
+        self,
+        overall_rate: float = 30,
+        private_rate: float = 1,
+        private_burst: float = 5,
+        group_rate: float = 20 / 60,
+        group_burst: float = 20,
+        max_retries: int = 3,
+    ):
+        self._overall = TokenBucket(overall_rate, overall_rate)
+        self._private = (private_rate, private_burst)
+        self._group = (group_rate, group_burst)
+        self._max_retries = max_retries
+        self._chats: dict[int | str, _Chat] = {}
+        self._queue: list[tuple[int, int]] = []   # (приоритет, номер) ждущих общего ведра
+        self._seq = itertools.count()
+        self._moved = asyncio.Event()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def _is_group(chat_id) -> bool:
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def _chat(self, chat_id) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= self.MAX_CHATS:
+                for key in [k for k, c in self._chats.items() if c.bucket.idle and not c.lock.locked()]:
+                    del self._chats[key]
+            rate, burst = self._group if self._is_group(chat_id) else self._private
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate, burst))
+        return chat
+
+    async def _take_overall(self, priority: int, cost: float):
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        try:
+            while True:
+                if self._queue[0] != ticket:
+                    # впереди запрос важнее или раньше — ждём, пока очередь сдвинется
+                    await self._moved.wait()
+                    continue
+                delay = self._overall.delay(cost)
+                if delay <= 0:
+                    self._overall.take(cost)
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._moved.set()
+            self._moved = asyncio.Event()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        chat = self._chat(chat_id) if chat_id is not None and creates_messages(endpoint) else None
+        priority = (rate_limit_args or {}).get("priority", INTERACTIVE)
+        cost = _cost(endpoint, data)
+
+        for attempt in range(self._max_retries + 1):
+            if chat:
+                async with chat.lock:
+                    await _take(chat.bucket, cost)
+            await self._take_overall(priority, cost)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self._max_retries:
+                    raise
+                logger.warning("%s в %s: flood wait %s с, повтор %s", endpoint, chat_id, e.retry_after, attempt + 1)
+                (chat.bucket if chat else self._overall).pause(e.retry_after + 0.1)
@@ -0,0 +1,97 @@
+from functools import lru_cache
+from html import escape
+
+from keyboards import POINT_TYPES
+from locations import ALL_LOCATIONS
+
+# ---------- Текст поста ----------
+# Один и тот же пост рисуется на предпросмотре, при отправке модераторам и
+# при публикации в канал. Справочники и хэштеги водоёмов готовятся при
+# импорте, пользовательский текст экранируется под parse_mode="HTML", а
+# готовый текст кэшируется по значениям полей — повторный вызов для того же
+# черновика отдаёт строку из кэша.
+
+POINT_TYPE_NAMES = dict(POINT_TYPES)
+
+FISH_NAMES = {
+    "mix":   "Разнорыбица",
+    "carp":  "Карп",
+    "pike":  "Щука",
+    "perch": "Окунь",
+    "bream": "Лещ",
+}
+
+FISHING_NAMES = {
+    "donka":    "Донка кл.",
+    "poplavok": "Поплавок гл.",
+    "spin":     "Спиннинг ск.",
+    "trol":     "Троллинг кл.",
+    "pilk":     "Пилкинг",
+}
+
+TEMP_NAMES = {
+    "normal": "Нормальная",
+    "high": "Повышенная",
+    "low":  "Пониженная",
+}
+
+
+def _hashtag(lake: str) -> str:
+    return "#" + (
+        lake.lower()
+        .replace(" ", "_")
+        .replace(".", "")
+        .replace("ё", "е")
+    )
+
+
+HASHTAGS = {code: escape(_hashtag(name)) for code, name in ALL_LOCATIONS.items()}
+
+_HEAD = (
+    "📍 Водоём:  {hashtag}\n"
+    "🎯 Точка: {types}\n"
+    "🐟 Рыба: {fish}\n"
+    "🎣 Ловля: {fishing}\n"
+    "🗺 Координаты: {coords}"
+)
+
+
+def build_post_text(data: dict) -> str:
+    """Текст поста (HTML) из черновика."""
+    return _render(
+        data.get("location") or "",
+        tuple(data.get("point_types") or ()),
+        data.get("fish_type") or "",
+        data.get("fishing_type") or "",
+        data.get("fishing_extra") or "",
+        data.get("coords") or "",
+        data.get("temp") or "",
+        data.get("comment") or "",
+        data.get("author") or "",
+    )
+
+
+@lru_cache(maxsize=1024)
+def _render(location, types, fish, fishing, extra, coords, temp, comment, author) -> str:
+    hashtag = HASHTAGS.get(location) or escape(_hashtag(str(location)))
+    fishing_text = escape(FISHING_NAMES.get(fishing, str(fishing)))
+    if extra:
+        fishing_text += " " + escape(str(extra))
+
+    lines = [_HEAD.format(
+        hashtag=hashtag,
+        types=escape(", ".join(POINT_TYPE_NAMES.get(t, str(t)) for t in types)) if types else "—",
+        fish=escape(FISH_NAMES.get(fish, str(fish))),
+        fishing=fishing_text,
+        coords=escape(str(coords)),
+    )]
+
+    # 🌡 Добавляем температуру, только если выбрана
+    if temp and str(temp).lower() not in ("none", "null", "nan"):
+        lines.append(f"🌡 Температура: {escape(TEMP_NAMES.get(temp, str(temp)))}")
+
+    if comment:
+        lines.append(f"📝 Комментарий: {escape(str(comment))}")
+
+    lines.append(f"👤 Автор: {escape(str(author)) if author else 'неизвестен'}")
+    return "\n".join(lines)
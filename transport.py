@@ -0,0 +1,140 @@
+import importlib.util
+import logging
+
+import httpx
+from telegram.error import NetworkError, TimedOut
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+# ---------- Транспорт: отдельные пулы соединений ----------
+# Раньше все вызовы Bot API шли через один HTTPXRequest с read_timeout=120:
+# answerCallbackQuery и editMessageText ждали свободного соединения за
+# медленными sendMediaGroup и сами могли висеть по две минуты. Теперь
+# запросы разведены по двум пулам:
+# - INTERACTIVE — ответы на нажатия, правки, личные сообщения: много
+#   соединений, короткие таймауты, соединения держатся тёплыми;
+# - MEDIA — альбомы, фото, копирование постов в канал и любые запросы
+#   с файлами: свои несколько соединений и длинные таймауты.
+# Зависшая загрузка занимает соединение только в своём пуле.
+# HTTP/2 включается, если установлен пакет h2 (pip install "httpx[http2]").
+
+MEDIA_METHODS = {
+    "sendMediaGroup", "sendPhoto", "sendVideo", "sendDocument", "sendAnimation",
+    "sendAudio", "sendVoice", "sendVideoNote", "sendSticker", "editMessageMedia",
+    "copyMessages", "forwardMessages",
+}
+
+HTTP_VERSION = "2" if importlib.util.find_spec("h2") else "1.1"
+
+# (размер пула, connect, read, write, ожидание соединения, keep-alive) в секундах
+INTERACTIVE = dict(pool_size=32, connect=5, read=10, write=10, pool=3, keepalive=60)
+MEDIA = dict(pool_size=8, connect=30, read=120, write=120, pool=60, keepalive=15)
+
+
+class PoolRequest(BaseRequest):
+    """
+    Пул соединений Bot API на своём httpx.AsyncClient (BaseRequest — точка
+    расширения PTB для сетевого слоя): размер пула, таймауты и keep-alive
+    задаются здесь, а write-таймаут один и для запросов с файлами.
+    """
+
+    __slots__ = ("_settings", "_client", "_read")
+
+    def __init__(self, *, pool_size: int, connect: float, read: float, write: float,
+                 pool: float, keepalive: float):
+        self._read = read
+        self._settings = dict(
+            timeout=httpx.Timeout(connect=connect, read=read, write=write, pool=pool),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive,
+            ),
+            http1=HTTP_VERSION == "1.1",
+            http2=HTTP_VERSION == "2",
+        )
+        self._client = httpx.AsyncClient(**self._settings)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self._read
+
+    async def initialize(self) -> None:
+        if self._client.is_closed:
+            self._client = httpx.AsyncClient(**self._settings)
+
+    async def shutdown(self) -> None:
+        if not self._client.is_closed:
+            await self._client.aclose()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        if self._client.is_closed:
+            raise RuntimeError("PoolRequest не инициализирован")
+
+        # таймаут, не заданный в вызове метода бота, — из настроек пула
+        def pick(value, default):
+            return default if value is BaseRequest.DEFAULT_NONE else value
+
+        default = self._client.timeout
+        timeout = httpx.Timeout(
+            connect=pick(connect_timeout, default.connect),
+            read=pick(read_timeout, default.read),
+            write=pick(write_timeout, default.write),
+            pool=pick(pool_timeout, default.pool),
+        )
+        try:
+            res = await self._client.request(
+                method=method,
+                url=url,
+                headers={"User-Agent": self.USER_AGENT},
+                timeout=timeout,
+                files=request_data.multipart_data if request_data else None,
+                data=request_data.json_parameters if request_data else None,
+            )
+        except httpx.PoolTimeout as e:
+            raise TimedOut("Все соединения пула заняты, запрос не дождался свободного") from e
+        except httpx.TimeoutException as e:
+            raise TimedOut from e
+        except httpx.HTTPError as e:
+            raise NetworkError(f"httpx.{e.__class__.__name__}: {e}") from e
+        return res.status_code, res.content
+
+
+class RoutedRequest(BaseRequest):
+    """Выбирает пул по методу Bot API (последний сегмент URL)."""
+
+    __slots__ = ("interactive", "media")
+
+    def __init__(self, interactive: BaseRequest | None = None, media: BaseRequest | None = None):
+        self.interactive = interactive or PoolRequest(**INTERACTIVE)
+        self.media = media or PoolRequest(**MEDIA)
+        logger.info("Bot API: пулы interactive/media, HTTP/%s", HTTP_VERSION)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self.interactive.read_timeout
+
+    def route(self, url: str, request_data=None) -> BaseRequest:
+        if url.rsplit("/", 1)[-1] in MEDIA_METHODS:
+            return self.media
+        if request_data is not None and request_data.contains_files:
+            return self.media
+        return self.interactive
+
+    async def initialize(self) -> None:
+        await self.interactive.initialize()
+        await self.media.initialize()
+
+    async def shutdown(self) -> None:
+        await self.interactive.shutdown()
+        await self.media.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        return await self.route(url, request_data).do_request(
+            url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout,
+        )
@@ -0,0 +1,357 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import time
+from contextvars import ContextVar
+from http import HTTPStatus
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+from telegram import Update
+from telegram.ext import Application, ExtBot
+
+from processing import is_toggle, update_key
+
+logger = logging.getLogger(__name__)
+
+# ---------- Ответ на callback прямо в ответе вебхука ----------
+# Telegram разрешает вернуть в теле ответа на POST вебхука один вызов
+# Bot API ({"method": "answerCallbackQuery", ...}). Почти каждое нажатие
+# кнопки начинается с q.answer(), поэтому этот вызов можно не отправлять
+# отдельным HTTPS-запросом, а отдать в ответе на сам апдейт.
+#
+# Как это устроено:
+# - вебхук кладёт апдейт в update_queue и ждёт InlineReply этого апдейта;
+# - InlineAnswerApplication.process_update делает InlineReply текущим
+#   (contextvar) на время обработки;
+# - InlineAnswerBot перехватывает answerCallbackQuery: первый ответ
+#   откладывается, повторный (алерт) сливается с ним в один;
+# - ответ уходит в тело HTTP, как только обработчик делает любой другой
+#   вызов Bot API или заканчивает обработку. Всё, что после, — обычные
+#   запросы.
+
+INLINE_METHODS = {"answerCallbackQuery"}
+INLINE_WAIT = 2.0   # сек: дольше держать POST не стоит — ответим пустым телом
+
+_reply: ContextVar["InlineReply | None"] = ContextVar("inline_reply", default=None)
+_waiting: dict[int, "InlineReply"] = {}
+
+
+class InlineReply:
+    """Тело ответа на POST вебхука для одного апдейта."""
+
+    __slots__ = ("payload", "future")
+
+    def __init__(self):
+        self.payload: dict | None = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def defer(self, endpoint: str, data: dict) -> bool:
+        """True — вызов отложен в ответ вебхука и в Bot API не пойдёт."""
+        if self.future.done():
+            return False
+        if endpoint not in INLINE_METHODS:
+            # сначала пусть уйдёт ответ на callback, потом правка сообщения
+            self.flush()
+            return False
+        if self.payload is None:
+            self.payload = {"method": endpoint, **data}
+            return True
+        if self.payload["method"] == endpoint and self.payload.get("callback_query_id") == data.get("callback_query_id"):
+            # второй answer() того же нажатия — алерт: сливаем в один ответ
+            self.payload.update(data)
+            return True
+        self.flush()
+        return False
+
+    def flush(self):
+        if not self.future.done():
+            self.future.set_result(self.payload)
+
+
+class InlineAnswerBot(ExtBot):
+    async def _do_post(self, endpoint, data, **kwargs):
+        reply = _reply.get()
+        if reply is not None and reply.defer(endpoint, data):
+            return True   # answerCallbackQuery возвращает True
+        return await super()._do_post(endpoint, data, **kwargs)
+
+
+class InlineAnswerApplication(Application):
+    async def process_update(self, update: object) -> None:
+        reply = _waiting.pop(update.update_id, None) if isinstance(update, Update) else None
+        if reply is None:
+            return await super().process_update(update)
+        token = _reply.set(reply)
+        try:
+            await super().process_update(update)
+        finally:
+            _reply.reset(token)
+            reply.flush()
+
+
+def _parse_update(handler: tornado.web.RequestHandler, app: Application) -> Update | None:
+    """Проверки заголовков и разбор тела POST — как в вебхуке PTB."""
+    if handler.request.headers.get("Content-Type") != "application/json":
+        raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+    secret_token = handler.secret_token
+    if secret_token and handler.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+        raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+    try:
+        update = Update.de_json(json.loads(handler.request.body), app.bot)
+    except Exception as e:
+        logger.critical("Не удалось разобрать апдейт из вебхука", exc_info=e)
+        raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST) from e
+    if update:
+        app.bot.insert_callback_data(update)
+    return update
+
+
+class InlineAnswerHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, app: Application, secret_token: str | None):
+        self.app = app
+        self.secret_token = secret_token
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", 'application/json; charset="utf-8"')
+
+    async def post(self):
+        update = _parse_update(self, self.app)
+        if not update:
+            return
+
+        reply = _waiting[update.update_id] = InlineReply()
+        await self.app.update_queue.put(update)
+        try:
+            payload = await asyncio.wait_for(asyncio.shield(reply.future), INLINE_WAIT)
+        except asyncio.TimeoutError:
+            # дальше не ждём: что успело отложиться — отдаём, остальное пойдёт обычными запросами
+            reply.flush()
+            payload = reply.future.result()
+            _waiting.pop(update.update_id, None)
+
+        if payload:
+            self.write(json.dumps(payload, ensure_ascii=False))
+
+    def log_request(self):
+        pass
+
+
+# ---------- Быстрый ответ вебхука и ограниченная очередь ----------
+# Вебхук кладёт апдейт в очередь UpdateQueue и сразу отвечает 200 —
+# медленный обработчик больше не задерживает ответ Telegram. Очередь
+# ограничена:
+# - заполнена на SHED_RATIO — нажатия кнопок-переключателей (processing.
+#   is_toggle) отбрасываются, а в теле ответа уходит answerCallbackQuery
+#   «нажмите ещё раз», чтобы у пользователя не крутились часики;
+# - заполнена целиком — 503: Telegram сам пришлёт апдейт повторно позже,
+#   сообщения и фото не теряются.
+# Заполненность считается по всем принятым и ещё не обработанным апдейтам.
+# Из очереди в обработку одновременно уходят апдейты не больше чем
+# MAX_IN_FLIGHT разных пользователей (ключей processing.update_key):
+# следующий апдейт того же пользователя слота не берёт, а ждёт его
+# очереди в процессоре — закидавший бота кликами занимает один слот.
+# Глубина очереди, ожидание и счётчики отброшенных — на GET /metrics
+# (с заголовком Authorization: Bearer <secret_token>).
+
+QUEUE_MAX = 1000
+SHED_RATIO = 0.8
+MAX_IN_FLIGHT = 256      # пользователей (ключей) в обработке одновременно
+SHED_ANSWER = "⏳ Бот перегружен, нажмите ещё раз"
+
+
+class UpdateQueue:
+    ACCEPTED, SHED, FULL = "accepted", "shed", "full"
+
+    def __init__(self, app: Application, maxsize: int = QUEUE_MAX, max_in_flight: int = MAX_IN_FLIGHT):
+        self.app = app
+        self.maxsize = maxsize
+        self.shed_at = int(maxsize * SHED_RATIO)
+        self._queue: asyncio.Queue[tuple[float, object]] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._keys: dict[object, int] = {}   # ключ -> его апдейтов в обработке
+        self._pending = 0                    # принято и ещё не обработано
+        self._in_flight = 0
+        self._task: asyncio.Task | None = None
+        self.accepted = self.shed = self.rejected = 0
+        self.wait_sum = 0.0
+        self.wait_count = 0
+        self.wait_max = 0.0
+
+    def offer(self, update: object) -> str:
+        if self._pending >= self.shed_at and is_toggle(update):
+            self.shed += 1
+            return self.SHED
+        if self._pending >= self.maxsize:
+            self.rejected += 1
+            return self.FULL
+        self._pending += 1
+        self._queue.put_nowait((time.monotonic(), update))
+        self.accepted += 1
+        return self.ACCEPTED
+
+    def start(self):
+        self._task = asyncio.create_task(self._dispatch(), name="webhook:update_queue")
+
+    async def stop(self, timeout: float = 10):
+        """Доделать то, что уже в очереди (не дольше timeout), и остановиться."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Остановка: в очереди осталось %s апдейтов", self._queue.qsize())
+        if self._task:
+            self._task.cancel()
+
+    async def _dispatch(self):
+        processor = self.app.update_processor
+        while True:
+            queued_at, update = await self._queue.get()
+            key = update_key(update)
+            if key is None:
+                key = object()   # без ключа — сам по себе
+            if key not in self._keys:
+                await self._slots.acquire()
+            self._keys[key] = self._keys.get(key, 0) + 1
+            wait = time.monotonic() - queued_at
+            self.wait_sum += wait
+            self.wait_count += 1
+            self.wait_max = max(self.wait_max, wait)
+            self._in_flight += 1
+            # processor держит порядок апдейтов одного пользователя (processing.py)
+            self.app.create_task(
+                self._process(key, processor.process_update(update, self.app.process_update(update))),
+                update=update,
+            )
+
+    async def _process(self, key, coroutine):
+        try:
+            await coroutine
+        finally:
+            self._in_flight -= 1
+            self._pending -= 1
+            self._keys[key] -= 1
+            if not self._keys[key]:
+                del self._keys[key]
+                self._slots.release()
+            self._queue.task_done()
+
+    def metrics(self) -> str:
+        """Текстовый формат Prometheus. wait_max сбрасывается при каждом чтении."""
+        wait_max, self.wait_max = self.wait_max, 0.0
+        return "".join(f"webhook_{name} {value}\n" for name, value in (
+            ("queue_depth", self._queue.qsize()),
+            ("queue_capacity", self.maxsize),
+            ("in_flight", self._in_flight),
+            ("in_flight_users", len(self._keys)),
+            ("updates_accepted_total", self.accepted),
+            ("updates_shed_total", self.shed),
+            ("updates_rejected_total", self.rejected),
+            ("queue_wait_seconds_sum", round(self.wait_sum, 6)),
+            ("queue_wait_seconds_count", self.wait_count),
+            ("queue_wait_seconds_max", round(wait_max, 6)),
+        ))
+
+
+class FastAckHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, app: Application, queue: UpdateQueue, secret_token: str | None):
+        self.app = app
+        self.queue = queue
+        self.secret_token = secret_token
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", 'application/json; charset="utf-8"')
+
+    async def post(self):
+        update = _parse_update(self, self.app)
+        if not update:
+            return
+        result = self.queue.offer(update)
+        if result == UpdateQueue.FULL:
+            raise tornado.web.HTTPError(HTTPStatus.SERVICE_UNAVAILABLE)
+        if result == UpdateQueue.SHED:
+            self.write(json.dumps({
+                "method": "answerCallbackQuery",
+                "callback_query_id": update.callback_query.id,
+                "text": SHED_ANSWER,
+            }, ensure_ascii=False))
+
+    def log_request(self):
+        pass
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("GET",)
+
+    def initialize(self, queue: UpdateQueue, secret_token: str):
+        self.queue = queue
+        self.secret_token = secret_token
+
+    def get(self):
+        # порт вебхука публичный: без секрета метрики не отдаём
+        auth = self.request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode(), f"Bearer {self.secret_token}".encode()):
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(self.queue.metrics())
+
+
+async def serve_webhook(app: Application, *, listen: str, port: int, url_path: str,
+                        webhook_url: str, secret_token: str | None = None,
+                        inline_answer: bool = False, queue_size: int = QUEUE_MAX):
+    """
+    То же, что app.run_webhook(), но со своим HTTP-сервером: либо быстрый
+    ответ и ограниченная очередь (по умолчанию), либо ответ на callback в
+    теле ответа (inline_answer). Жизненный цикл Application
+    (post_init / post_stop / post_shutdown) повторяет run_webhook.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+
+    queue = None
+    if inline_answer:
+        routes = [(rf"/{url_path}/?", InlineAnswerHandler, {"app": app, "secret_token": secret_token})]
+    else:
+        queue = UpdateQueue(app, queue_size)
+        routes = [
+            (rf"/{url_path}/?", FastAckHandler, {"app": app, "queue": queue, "secret_token": secret_token}),
+        ]
+        if secret_token:
+            routes.append((r"/metrics", MetricsHandler, {"queue": queue, "secret_token": secret_token}))
+        else:
+            logger.warning("WEBHOOK_SECRET не задан — /metrics отключён")
+    server = HTTPServer(tornado.web.Application(routes))
+    try:
+        await app.bot.set_webhook(webhook_url, secret_token=secret_token)
+        server.listen(port, address=listen)
+        await app.start()
+        if queue:
+            queue.start()
+        logger.info("Webhook (%s) слушает %s:%s/%s",
+                    "ответы на callback в теле ответа" if inline_answer else f"очередь на {queue_size}",
+                    listen, port, url_path)
+        await stop.wait()
+    finally:
+        server.stop()
+        if queue:
+            await queue.stop()
+        await server.close_all_connections()
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
@@ -0,0 +1,201 @@
+import json
+from dataclasses import dataclass, replace
+from typing import Awaitable, Callable, Iterable
+
+from telegram import InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from callbacks import CallbackRouter, encode
+from database import save_draft_async
+from editor import edit_markup, edit_soon, edit_text, remember
+from keyboards import attach_nav, NEXT_LABEL
+
+# ---------- Мастер поста как таблица шагов ----------
+# Порядок шагов, экраны, проверки перед «Далее» и ключи черновика, которые
+# стираются при «Назад», — это данные (Step), а не ветки if в go_back/go_next.
+# По таблице строятся переходы, маршруты кнопок и состояния ConversationHandler.
+# Переход = поиск шага в dict + экран из готового текста и закэшированной
+# клавиатуры (все варианты клавиатур прогреваются при сборке).
+
+
+def _no_options(data: dict) -> None:
+    return None
+
+
+@dataclass(frozen=True)
+class Step:
+    """Один экран мастера."""
+
+    name: str                 # имя шага, оно же аргумент go_back:/go_next:
+    state: int                # состояние ConversationHandler
+    text: str | Callable[[dict, int | None], str]   # HTML; "{n}" — номер шага
+    options: Callable[[dict], InlineKeyboardMarkup | None] = _no_options
+    next_label: str | Callable[[dict], str] = NEXT_LABEL
+    validate: Callable[[dict], str | None] | None = None   # текст алерта, если «Далее» рано
+    keys: tuple[str, ...] = ()        # данные шага: стираются при уходе с него «Назад»
+    actions: tuple = ()               # свои кнопки шага: пары (маршрут, обработчик)
+    inputs: tuple = ()                # MessageHandler'ы шага
+    leave: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable] | None = None  # перед «Назад»/«Далее»
+    samples: tuple[dict, ...] = ({},)  # варианты user_data для прогрева клавиатур
+    chained: bool = True              # участвует в цепочке «Назад / Далее»
+    numbered: bool = True
+    prev: str | None = None
+    next: str | None = None
+    number: int | None = None
+
+    def keyboard(self, data: dict) -> InlineKeyboardMarkup:
+        label = self.next_label if isinstance(self.next_label, str) else self.next_label(data)
+        return attach_nav(self.options(data), self.prev, self.next, label)
+
+    def render(self, data: dict) -> tuple[str, InlineKeyboardMarkup]:
+        text = self.text if isinstance(self.text, str) else self.text(data, self.number)
+        return text, self.keyboard(data)
+
+
+class Wizard:
+    """
+    Собирает шаги в цепочку: prev/next и номера проставляются по порядку
+    списка (явно заданные prev/next не трогаются), статичные тексты
+    форматируются один раз.
+    on_lost — обработчик нажатия на шаге, до которого черновик уже не
+    доходит (см. lost); его результат заменяет обычный маршрут.
+    """
+
+    def __init__(self, steps: Iterable[Step], on_lost=None):
+        steps = list(steps)
+        chain = [step.name for step in steps if step.chained]
+        number = 0
+        self.steps: dict[str, Step] = {}
+        for step in steps:
+            changes = {}
+            if step.chained:
+                i = chain.index(step.name)
+                if step.prev is None and i > 0:
+                    changes["prev"] = chain[i - 1]
+                if step.next is None and i + 1 < len(chain):
+                    changes["next"] = chain[i + 1]
+            if step.numbered:
+                number += 1
+                changes["number"] = number
+            if isinstance(step.text, str):
+                changes["text"] = step.text.format(n=changes.get("number"))
+            self.steps[step.name] = replace(step, **changes)
+
+        for step in self.steps.values():
+            for target in (step.prev, step.next):
+                if target is not None and target not in self.steps:
+                    raise ValueError(f"{step.name}: переход на неизвестный шаг {target!r}")
+            for sample in step.samples:
+                step.keyboard(sample)
+
+        self.on_lost = on_lost
+        self._index = {name: i for i, name in enumerate(self.order)}
+        self.routers = {step.state: self._router(step) for step in self.steps.values()}
+
+    def __getitem__(self, name: str) -> Step:
+        return self.steps[name]
+
+    @property
+    def order(self) -> list[str]:
+        """Шаги в порядке прохождения по «Далее»."""
+        first = next(step for step in self.steps.values() if step.chained)
+        names = [first.name]
+        while self.steps[names[-1]].next:
+            names.append(self.steps[names[-1]].next)
+        return names
+
+    def first_invalid(self, data: dict) -> tuple[Step, str] | None:
+        """Первый по порядку шаг, чья проверка не проходит, и текст алерта."""
+        for name in self.order:
+            step = self.steps[name]
+            error = step.validate(data) if step.validate else None
+            if error:
+                return step, error
+        return None
+
+    def lost(self, step: Step, data: dict) -> bool:
+        """
+        Черновик не доходит до step: не заполнен один из предыдущих шагов.
+        Так выглядит диалог, чей черновик удалили (истёк TTL, сброшен):
+        шаг в ConversationHandler остался, а данных уже нет.
+        """
+        if step.name not in self._index:
+            return False
+        invalid = self.first_invalid(data)
+        return invalid is not None and self._index[invalid[0].name] < self._index[step.name]
+
+    def states(self) -> dict[int, list]:
+        return {step.state: [*step.inputs, self.routers[step.state]] for step in self.steps.values()}
+
+    # ---------- экраны ----------
+    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE, name: str,
+                   note: str | None = None, new: bool = False, soon: bool = False) -> int:
+        """
+        Показывает экран шага: редактирует сообщение с кнопкой (если экран
+        изменился, см. editor.py), а после ввода текста (или при new=True)
+        отвечает новым сообщением. note — строка над экраном («✅ Сохранено: …»).
+        soon=True — для переключателей: правка уходит после паузы в нажатиях.
+        """
+        step = self.steps[name]
+        text, markup = step.render(context.user_data)
+        if note:
+            text = f"{note}\n\n{text}"
+        q = update.callback_query
+        if q and soon:
+            edit_soon(q, text, reply_markup=markup, parse_mode="HTML")
+        elif q and not new:
+            await edit_text(q, text, reply_markup=markup, parse_mode="HTML")
+        else:
+            msg = await update.effective_message.reply_text(text, parse_mode="HTML", reply_markup=markup)
+            remember(msg, text, markup)
+        return step.state
+
+    async def refresh(self, update: Update, context: ContextTypes.DEFAULT_TYPE, name: str,
+                      soon: bool = False) -> int:
+        """Перерисовывает только клавиатуру шага (после выбора варианта)."""
+        step = self.steps[name]
+        markup = step.keyboard(context.user_data)
+        if soon:
+            edit_soon(update.callback_query, reply_markup=markup)
+        else:
+            await edit_markup(update.callback_query, markup)
+        return step.state
+
+    # ---------- навигация ----------
+    async def back(self, update: Update, context: ContextTypes.DEFAULT_TYPE, step: Step) -> int:
+        await update.callback_query.answer()
+        if step.leave:
+            await step.leave(update, context)
+        cleared = [key for key in step.keys if key in context.user_data]
+        for key in cleared:
+            del context.user_data[key]
+        if cleared:
+            await save_draft_async(update.effective_user.id, json.dumps(context.user_data))
+        return await self.show(update, context, step.prev)
+
+    async def forward(self, update: Update, context: ContextTypes.DEFAULT_TYPE, step: Step) -> int:
+        if step.leave:
+            await step.leave(update, context)
+        error = step.validate(context.user_data) if step.validate else None
+        await update.callback_query.answer(error, show_alert=bool(error))
+        if error:
+            return step.state
+        return await self.show(update, context, step.next)
+
+    def _router(self, step: Step) -> CallbackRouter:
+        routes = list(step.actions)
+        if step.prev:
+            async def go_back(update, context):
+                return await self.back(update, context, step)
+            routes.append((encode("go_back", step.prev), go_back))
+        if step.next:
+            async def go_next(update, context):
+                return await self.forward(update, context, step)
+            routes.append((encode("go_next", step.next), go_next))
+        guard = None
+        if self.on_lost:
+            async def guard(update, context):
+                if self.lost(step, context.user_data):
+                    return await self.on_lost(update, context)
+                return None
+        return CallbackRouter(step.name, routes, guard=guard)